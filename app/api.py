@@ -0,0 +1,250 @@
+import argparse
+import hmac
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from batch import process_site, resolve_stacks
+from job_control import JobCancelled
+from job_queue import STATUSES, JobQueue
+from scaffolder import ParallelScaffolder
+from site_index import SiteIndex
+from utils.model_manager import get_model_manager
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Address the API listens on; loopback only unless API_HOST says otherwise
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", 8080))
+
+# When set, every request except GET /health must send "Authorization: Bearer <API_TOKEN>"
+API_TOKEN = os.environ.get("API_TOKEN", "")
+
+# Site names accepted by the API: the directory name itself, so a name can never leave SITES_DIR
+SITE_NAME_PATTERN = re.compile(r"[a-z0-9][a-z0-9-]*")
+
+# Largest page of jobs GET /jobs returns
+MAX_LIST_LIMIT = 1000
+
+# Number of jobs generated at the same time; Ollama capacity is the real limit
+API_WORKERS = int(os.environ.get("API_WORKERS", 4))
+
+class JobWorkers:
+    def __init__(self, queue, workers=API_WORKERS, scaffold_workers=None):
+        """
+        Pool of threads taking jobs off the queue and generating their site. All workers share
+        one scaffolder, so scaffolding commands stay bounded however many jobs run at once.
+        """
+        self.queue = queue
+        self.workers = workers
+        self.scaffolder = ParallelScaffolder(max_workers=scaffold_workers, echo=False)
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        requeued = self.queue.requeue_interrupted()
+        if requeued:
+            print(f"Requeued {requeued} job(s) interrupted by the last shutdown.")
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self.scaffolder.shutdown()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            job = self.queue.claim(timeout=1.0)
+            if job is not None:
+                self.run(job)
+
+    def run(self, job):
+        """
+        Generate the site of one job and record its outcome. Never raises.
+        """
+        job_id = job["id"]
+        print(f"Job {job_id}: generating {job['params']['name']}")
+        try:
+            result = process_site(job["params"], self.scaffolder,
+                                  progress=lambda fraction, message: self.queue.update_progress(job_id, fraction, message))
+        except JobCancelled:
+            self.queue.finish(job_id, "cancelled")
+            print(f"Job {job_id}: cancelled")
+            return
+        except Exception as e:
+            self.queue.finish(job_id, "failed", error=str(e))
+            print(f"Job {job_id}: failed ({e})")
+            return
+
+        status = "succeeded" if result["status"] == "ok" else "failed"
+        self.queue.finish(job_id, status, result=result, error=result["error"])
+        print(f"Job {job_id}: {status} in {result['duration']}s")
+
+def validate_job(params):
+    """
+    Return an error message if the job parameters cannot describe a site, else None.
+    """
+    if not isinstance(params, dict):
+        return "Expected a JSON object"
+    if not str(params.get("name", "")).strip():
+        return "'name' is required"
+    if not isinstance(params["name"], str) or not SITE_NAME_PATTERN.fullmatch(params["name"]):
+        return "'name' must be a slug of lowercase letters, digits and dashes (e.g. acme-corp)"
+    if not resolve_stacks(params.get("stacks", "all")):
+        return f"No valid stacks in {params.get('stacks')!r}"
+    if str(params.get("action", "modify")).lower() not in ("reset", "modify"):
+        return f"Unknown action: {params.get('action')}"
+    return None
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    JSON API:
+      POST   /jobs                 queue a site ({name, type, description, stacks, theme, action})
+      GET    /jobs[?status=]       list jobs, newest first
+      GET    /jobs/<id>            job status, progress and result
+      GET    /jobs/<id>/progress   status and progress only
+      POST   /jobs/<id>/cancel     cancel a job (DELETE /jobs/<id> does the same)
+      GET    /sites[?stack=&name=] sites from the site index
+      GET    /health               queue counts, model readiness, cold/warm latency and Ollama backends
+    """
+    server_version = "WebsiteGenerator/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for job progress
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def authorized(self):
+        """
+        Return True if the request carries the API token (or no token is configured); otherwise
+        answer 401 and return False.
+        """
+        if not API_TOKEN:
+            return True
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode("utf-8"), API_TOKEN.encode("utf-8")):
+            return True
+        self.send_json(401, {"error": "Missing or invalid API token"})
+        return False
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        queue = self.server.queue
+
+        if url.path == "/health":
+            manager = get_model_manager()
+            return self.send_json(200, {"status": "ok", "jobs": queue.counts(),
+                                        "models": {"ready": manager.is_ready(), "latency": manager.get_latency()},
+                                        "backends": manager.pool.stats()})
+        if not self.authorized():
+            return
+        if url.path == "/jobs":
+            status = query.get("status")
+            if status and status not in STATUSES:
+                return self.send_json(400, {"error": f"Unknown status: {status}"})
+            try:
+                limit = int(query.get("limit", 100))
+            except ValueError:
+                return self.send_json(400, {"error": f"Invalid limit: {query['limit']}"})
+            return self.send_json(200, queue.list(status=status, limit=min(max(limit, 1), MAX_LIST_LIMIT)))
+        if url.path == "/sites":
+            index = SiteIndex(self.server.base_dir)
+            if query.get("scan", "1") != "0":
+                index.scan()
+            return self.send_json(200, index.query(stack=query.get("stack"), name=query.get("name")))
+
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)(/progress)?", url.path)
+        if match:
+            job = queue.get(match.group(1))
+            if job is None:
+                return self.send_json(404, {"error": "Job not found"})
+            if match.group(2):
+                job = {key: job[key] for key in ("id", "status", "progress", "message", "cancel_requested")}
+            return self.send_json(200, job)
+        self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        url = urlparse(self.path)
+        if url.path == "/jobs":
+            params = self.read_json()
+            error = validate_job(params)
+            if error:
+                return self.send_json(400, {"error": error})
+            job_id = self.server.queue.submit(params)
+            return self.send_json(202, self.server.queue.get(job_id))
+
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)/cancel", url.path)
+        if match:
+            return self.cancel(match.group(1))
+        self.send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)", urlparse(self.path).path)
+        if match:
+            return self.cancel(match.group(1))
+        self.send_json(404, {"error": "Not found"})
+
+    def cancel(self, job_id):
+        job = self.server.queue.cancel(job_id)
+        if job is None:
+            return self.send_json(404, {"error": "Job not found"})
+        self.send_json(202 if job["status"] == "running" else 200, job)
+
+def make_server(queue, host=API_HOST, port=API_PORT, base_dir=BASE_DIR):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.queue = queue
+    server.base_dir = base_dir
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the website generator as an HTTP API backed by a job queue.")
+    parser.add_argument("--host", default=API_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=API_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Number of jobs generated in parallel")
+    parser.add_argument("--scaffold-workers", type=int, default=None, help="Number of scaffolding commands run in parallel")
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    get_model_manager().start()
+    workers = JobWorkers(queue, workers=args.workers, scaffold_workers=args.scaffold_workers)
+    workers.start()
+    server = make_server(queue, args.host, args.port)
+    print(f"Website generator API listening on http://{args.host}:{args.port} with {args.workers} workers")
+    if not API_TOKEN and args.host not in ("127.0.0.1", "localhost", "::1"):
+        print(f"Warning: the API is reachable on {args.host} without authentication; set API_TOKEN.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        workers.stop()
+
+if __name__ == "__main__":
+    main()
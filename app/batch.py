@@ -0,0 +1,196 @@
+import argparse
+import contextvars
+import json
+import os
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from website import Website
+from theme_manager import ThemeManager
+from scaffolder import ParallelScaffolder
+from main import generate_website_content
+from content_pipeline import ContentPipeline
+from job_control import JobCancelled, site_lock
+from utils.model_manager import get_model_manager
+from utils.ollama_client import get_cache_stats
+from utils.tracing import get_summary, print_summary, traced
+
+SUPPORTED_STACKS = ["hugo", "next.js"]
+
+def load_manifest(manifest_file):
+    """
+    Load a YAML or JSON manifest. The manifest is either a list of sites or a mapping
+    with a 'sites' list and optional 'workers' setting.
+
+    Each site entry supports: name (required), type, description, stacks ('all' or a list),
+    theme and action ('reset' or 'modify', applied when the site already exists).
+    """
+    with open(manifest_file, 'r') as file:
+        if manifest_file.endswith(".json"):
+            manifest = json.load(file)
+        else:
+            manifest = yaml.safe_load(file)
+
+    if isinstance(manifest, list):
+        manifest = {"sites": manifest}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("sites"), list):
+        raise ValueError(f"Invalid manifest {manifest_file}: expected a list of sites.")
+
+    for index, site in enumerate(manifest["sites"]):
+        if not isinstance(site, dict) or not site.get("name"):
+            raise ValueError(f"Invalid manifest {manifest_file}: site #{index} has no name.")
+    return manifest
+
+def resolve_stacks(stacks):
+    """
+    Normalize the 'stacks' field of a manifest entry into a list of supported stacks.
+    """
+    if stacks is None or stacks == "all":
+        return list(SUPPORTED_STACKS)
+    if isinstance(stacks, str):
+        stacks = stacks.split(",")
+    stacks = [stack.strip().lower() for stack in stacks]
+    if "all" in stacks:
+        return list(SUPPORTED_STACKS)
+    return [stack for stack in stacks if stack in SUPPORTED_STACKS]
+
+@traced("batch.site")
+def process_site(site, scaffolder, progress=None):
+    """
+    Generate one site from its manifest entry without any prompts and return a result record.
+    All stacks of the site are scaffolded in parallel through the shared scaffolder while the
+    content is generated. Existing stacks with action 'modify' are updated incrementally: only
+    changed pages and those listed under `pages` are regenerated (`force` overwrites hand edits).
+    `progress(fraction, message)` is called between steps; it may raise JobCancelled to stop the site.
+    Jobs for the same site name in this process run one after the other.
+    """
+    started = time.time()
+    result = {"name": site["name"], "status": "ok", "stacks": {}, "error": None}
+    stacks = resolve_stacks(site.get("stacks"))
+    action = str(site.get("action", "modify")).lower()
+    report = progress or (lambda fraction, message: None)
+
+    # Jobs for the same site would race on its directories (reset, scaffolding, manifest), so they run one at a time
+    lock = site_lock(site["name"])
+    if lock.locked():
+        print(f"Waiting for the running job of site {site['name']}...")
+    with lock:
+        try:
+            if not stacks:
+                raise ValueError(f"No valid stacks in {site.get('stacks')!r}")
+            if action not in ("reset", "modify"):
+                raise ValueError(f"Unknown action: {action}")
+
+            website_type = str(site.get("type", "website")).lower()
+            pipeline = ContentPipeline(site["name"], website_type, site.get("description", ""))
+
+            websites = []
+            jobs = {}
+            for stack in stacks:
+                website = Website(stack=stack, website_name=site["name"], shared_content=None)
+                if not website.is_website_initialized():
+                    jobs[stack] = scaffolder.submit(website)
+                    result["stacks"][stack] = {"action": "initialized"}
+                elif action == "reset":
+                    jobs[stack] = scaffolder.submit(website, reset=True)
+                    result["stacks"][stack] = {"action": "reset"}
+                else:
+                    report(0.0, f"Updating {stack} content")
+                    update = website.modify_website(pipeline, pages=site.get("pages") or (), force=bool(site.get("force")))
+                    result["stacks"][stack] = {"action": "modified", "pages": update}
+                websites.append(website)
+
+            if jobs:
+                report(0.1, "Generating content")
+                content = generate_website_content(site["name"], website_type, site.get("description", ""))
+                for website in websites:
+                    website.shared_content = content
+            report(0.5, "Scaffolding " + ", ".join(jobs))
+
+            for index, website in enumerate(websites):
+                stack_result = result["stacks"][website.stack]
+                if website.stack in jobs:
+                    job = jobs[website.stack].result()
+                    stack_result["scaffold"] = {key: job[key] for key in ("status", "duration", "log_file")}
+                if not website.is_website_initialized():
+                    stack_result["action"] = "failed"
+                    result["status"] = "failed"
+                    continue
+                if website.stack in jobs:
+                    stack_result["pages"] = len(website.write_content())
+
+                if site.get("theme"):
+                    report(0.6 + 0.4 * index / len(websites), f"Applying theme {site['theme']} to {website.stack}")
+                    theme_manager = ThemeManager(website.stack, website.website_name, interactive=False)
+                    theme_manager.initialize_theme(site["theme"])
+                    theme_manager.change_theme(site["theme"])
+                    stack_result["theme"] = theme_manager.get_current_theme()
+        except JobCancelled:
+            raise
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+
+    result["duration"] = round(time.time() - started, 3)
+    return result
+
+def run_batch(manifest, workers=None, scaffold_workers=None):
+    """
+    Process every site of the manifest through a bounded worker pool.
+    Scaffolding commands of all sites share one pool of `scaffold_workers` slots.
+    Returns the per-site results in manifest order.
+    """
+    sites = manifest["sites"]
+    workers = workers or manifest.get("workers") or 4
+    scaffolder = ParallelScaffolder(max_workers=scaffold_workers or manifest.get("scaffold_workers"), echo=False)
+    results = [None] * len(sites)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, process_site, site, scaffolder): index
+                   for index, site in enumerate(sites)}
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index] = future.result()
+            print(f"[{results[index]['status']}] {results[index]['name']} ({results[index]['duration']}s)")
+    scaffolder.shutdown()
+    return results
+
+def write_report(results, report_file):
+    """
+    Write the batch report as JSON.
+    """
+    report = {
+        "total": len(results),
+        "succeeded": sum(1 for result in results if result["status"] == "ok"),
+        "failed": sum(1 for result in results if result["status"] != "ok"),
+        "cache": get_cache_stats(),
+        "models": get_model_manager().get_latency(),
+        "backends": get_model_manager().pool.stats(),
+        "stages": get_summary(),
+        "sites": results,
+    }
+    os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+    with open(report_file, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Batch report written to {report_file}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many websites from a manifest without prompts.")
+    parser.add_argument("manifest", help="YAML or JSON manifest listing the sites to generate")
+    parser.add_argument("--workers", type=int, default=None, help="Number of sites processed in parallel")
+    parser.add_argument("--scaffold-workers", type=int, default=None, help="Number of scaffolding commands run in parallel")
+    parser.add_argument("--report", default="batch-report.json", help="Where to write the per-site result report")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    get_model_manager().start()  # Loads the models while the first sites are scaffolded
+    results = run_batch(manifest, workers=args.workers, scaffold_workers=args.scaffold_workers)
+    report = write_report(results, args.report)
+    get_model_manager().print_latency()
+    print_summary()
+    print(f"Batch complete: {report['succeeded']} succeeded, {report['failed']} failed.")
+    return 0 if report["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
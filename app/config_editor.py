@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import tempfile
+import toml
+
+class ConfigParseError(Exception):
+    """
+    Raised when a config file cannot be parsed, so it cannot be edited structurally.
+    """
+
+# Top-level `key = value` line of a TOML document
+TOML_KEY_LINE = r'^(\s*){key}\s*=.*$'
+
+def atomic_write(path, content):
+    """
+    Write content to path through a temporary file and a rename, so readers never see a partial file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def load_toml(path):
+    try:
+        with open(path, 'r') as file:
+            return toml.load(file)
+    except toml.TomlDecodeError as e:
+        raise ConfigParseError(f"Cannot parse {path}: {e}")
+
+def get_hugo_theme(config_file):
+    """
+    Return the theme set in a Hugo config (a string, or the first entry of a theme list).
+    """
+    theme = load_toml(config_file).get("theme")
+    if isinstance(theme, list):
+        return theme[0] if theme else None
+    return theme
+
+def set_toml_key(content, key, value):
+    """
+    Set a top-level key in TOML text, keeping comments and formatting of every other line.
+    The key is replaced in place if present, otherwise inserted before the first table.
+    """
+    try:
+        toml.loads(content)
+    except toml.TomlDecodeError as e:
+        raise ConfigParseError(f"Cannot parse TOML config: {e}")
+
+    lines = content.splitlines()
+    new_line = f"{key} = {json.dumps(value)}"
+    key_pattern = re.compile(TOML_KEY_LINE.format(key=re.escape(key)))
+
+    first_table = next((index for index, line in enumerate(lines) if line.lstrip().startswith("[")), len(lines))
+    for index in range(first_table):
+        if key_pattern.match(lines[index]):
+            lines[index] = new_line
+            break
+    else:
+        insert_at = first_table
+        while insert_at > 0 and not lines[insert_at - 1].strip():
+            insert_at -= 1
+        lines.insert(insert_at, new_line)
+
+    new_content = "\n".join(lines) + "\n"
+    if toml.loads(new_content).get(key) != value:
+        raise ConfigParseError(f"Could not set '{key}' in TOML config")
+    return new_content
+
+def set_hugo_theme(config_file, theme):
+    """
+    Set the theme in hugo.toml and write the file atomically.
+    """
+    with open(config_file, 'r') as file:
+        content = file.read()
+    atomic_write(config_file, set_toml_key(content, "theme", theme))
+
+def load_package_json(package_file):
+    try:
+        with open(package_file, 'r') as file:
+            return json.load(file)
+    except ValueError as e:
+        raise ConfigParseError(f"Cannot parse {package_file}: {e}")
+
+def update_package_json(package_file, updates):
+    """
+    Merge nested updates into package.json (e.g. {"config": {"theme": "x"}}) and write it atomically.
+    """
+    package = load_package_json(package_file)
+
+    def merge(target, source):
+        for key, value in source.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            else:
+                target[key] = value
+
+    merge(package, updates)
+    atomic_write(package_file, json.dumps(package, indent=2) + "\n")
+    return package
+
+def get_nextjs_theme(package_file):
+    """
+    Return the theme recorded in the npm "config" section of package.json.
+    """
+    return load_package_json(package_file).get("config", {}).get("theme")
+
+def set_nextjs_theme(package_file, theme):
+    """
+    Record the theme in package.json's npm "config" section (exposed to scripts as npm_package_config_theme).
+    """
+    update_package_json(package_file, {"config": {"theme": theme}})
+
+# Value of `output` in next.config.js: a static export while static_build runs `next build`
+# (it sets NEXT_STATIC_EXPORT), the default server build otherwise, so `npm start` keeps working
+NEXTJS_STATIC_OUTPUT = "process.env.NEXT_STATIC_EXPORT ? 'export' : undefined"
+
+# The `output` key, and the opening of the config object, in next.config.js
+NEXTJS_OUTPUT_KEY = re.compile(r"^(\s*)output\s*:.*?,?\s*$", re.MULTILINE)
+NEXTJS_CONFIG_OBJECT = re.compile(r"(?:nextConfig\s*=|module\.exports\s*=|export\s+default)\s*\{")
+
+def set_nextjs_static_export(config_file):
+    """
+    Make next.config.js export the site to out/ when it is built for the static tier.
+    Returns True if the file was changed.
+    """
+    with open(config_file, 'r') as file:
+        content = file.read()
+
+    new_line = f"output: {NEXTJS_STATIC_OUTPUT},"
+    if NEXTJS_OUTPUT_KEY.search(content):
+        new_content = NEXTJS_OUTPUT_KEY.sub(lambda match: match.group(1) + new_line, content, count=1)
+    else:
+        match = NEXTJS_CONFIG_OBJECT.search(content)
+        if match is None:
+            raise ConfigParseError(f"Cannot find the config object in {config_file}")
+        rest = content[match.end():]
+        if rest.lstrip(" \t").startswith("}"):
+            rest = "\n" + rest.lstrip(" \t")  # Empty object: close it on its own line
+        new_content = content[:match.end()] + f"\n  {new_line}" + rest
+
+    if new_content == content:
+        return False
+    atomic_write(config_file, new_content)
+    return True
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import time
+from config_editor import atomic_write
+
+# Manifest kept at the root of every generated site
+MANIFEST_FILE = ".content-manifest.json"
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return hash_text(file.read())
+    except FileNotFoundError:
+        return None
+
+class ContentManifest:
+    def __init__(self, site_dir):
+        """
+        Record of the generated pages of one site: the outline they came from and, per page, the
+        hash of its prompt (its inputs) and of the file that was written (its output). A page
+        whose file no longer matches its output hash was edited by hand.
+        """
+        self.site_dir = site_dir
+        self.manifest_file = os.path.join(site_dir, MANIFEST_FILE)
+        self.outline = None
+        self.outline_hash = None
+        self.pages = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.manifest_file, 'r') as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        self.outline = data.get("outline")
+        self.outline_hash = data.get("outline_hash")
+        self.pages = data.get("pages", {})
+
+    def save(self):
+        data = {"outline": self.outline, "outline_hash": self.outline_hash, "pages": self.pages}
+        atomic_write(self.manifest_file, json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+    def get_file(self, slug):
+        record = self.pages.get(slug)
+        return os.path.join(self.site_dir, record["file"]) if record else None
+
+    def is_hand_edited(self, slug):
+        """
+        Return True if the page's file exists and differs from what was last generated.
+        """
+        record = self.pages.get(slug)
+        if not record:
+            return False
+        current = hash_file(os.path.join(self.site_dir, record["file"]))
+        return current is not None and current != record["output_hash"]
+
+    def needs_update(self, slug, prompt_hash):
+        """
+        Return True if the page was never generated, its inputs changed or its file is missing.
+        """
+        record = self.pages.get(slug)
+        return (record is None or record["prompt_hash"] != prompt_hash
+                or not os.path.exists(os.path.join(self.site_dir, record["file"])))
+
+    def record(self, slug, page_file, prompt_hash, content):
+        self.pages[slug] = {
+            "file": os.path.relpath(page_file, self.site_dir),
+            "prompt_hash": prompt_hash,
+            "output_hash": hash_text(content),
+            "generated_at": time.time(),
+        }
@@ -0,0 +1,456 @@
+import asyncio
+import json
+import os
+import re
+from config_editor import atomic_write
+from content_manifest import ContentManifest
+from content_store import ContentStore
+from image_pipeline import add_page_images
+from renderers import HOMEPAGE, get_page_file, render_page
+from utils.ollama_cache import make_cache_key
+from utils.model_manager import get_model_manager
+from utils.ollama_client import DEFAULT_MODEL, DEFAULT_NUM_PARALLEL, achat_with_ollama, chat_with_ollama, stream_text_to_files
+from utils.tracing import span
+
+# Upper bound on the number of pages in a generated site
+MAX_PAGES = int(os.environ.get("CONTENT_MAX_PAGES", 8))
+
+# Extra attempts for a page whose output does not match its schema
+RETRIES = int(os.environ.get("CONTENT_RETRIES", 2))
+
+# Directory of a site where pages of non-Markdown stacks are spooled while they stream
+STREAM_SPOOL_DIR = ".content-stream"
+
+# Schemas passed to Ollama's `format` option; replies are constrained to these shapes
+OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pages": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "slug": {"type": "string"},
+                    "title": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+                "required": ["slug", "title", "description"],
+            },
+        },
+    },
+    "required": ["pages"],
+}
+
+PAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "front_matter": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "description": {"type": "string"},
+            },
+            "required": ["title", "description"],
+        },
+        "sections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "heading": {"type": "string"},
+                    "body": {"type": "string"},
+                },
+                "required": ["heading", "body"],
+            },
+        },
+    },
+    "required": ["front_matter", "sections"],
+}
+
+class ContentValidationError(ValueError):
+    """
+    Raised when a structured reply is not valid JSON or does not match its schema.
+    """
+
+def slugify(text):
+    slug = re.sub(r"[^a-z0-9]+", "-", str(text).lower()).strip("-")
+    return slug or HOMEPAGE
+
+def _require_string(data, key, where):
+    value = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(value, str) or not value.strip():
+        raise ContentValidationError(f"{where}: '{key}' must be a non-empty string")
+    return value.strip()
+
+def validate_outline(data, max_pages=MAX_PAGES):
+    """
+    Return the outline's pages with unique slugs, the homepage first, at most max_pages of them.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("pages"), list) or not data["pages"]:
+        raise ContentValidationError("outline: 'pages' must be a non-empty list")
+
+    pages = []
+    seen = set()
+    for index, entry in enumerate(data["pages"]):
+        where = f"outline page {index}"
+        slug = slugify(_require_string(entry, "slug", where))
+        if slug in ("home", "homepage", "index", "_index"):
+            slug = HOMEPAGE
+        if slug in seen:
+            continue
+        seen.add(slug)
+        pages.append({"slug": slug, "title": _require_string(entry, "title", where),
+                      "description": _require_string(entry, "description", where)})
+
+    if HOMEPAGE not in seen:
+        pages[0]["slug"] = HOMEPAGE
+    pages.sort(key=lambda page: page["slug"] != HOMEPAGE)
+    return pages[:max_pages]
+
+def validate_page(data, entry):
+    """
+    Return a normalised page built from a reply to the page prompt of an outline entry.
+    """
+    where = f"page '{entry['slug']}'"
+    if not isinstance(data, dict):
+        raise ContentValidationError(f"{where}: expected an object")
+    front_matter = data.get("front_matter")
+    if not isinstance(front_matter, dict):
+        raise ContentValidationError(f"{where}: 'front_matter' must be an object")
+    sections = data.get("sections")
+    if not isinstance(sections, list) or not sections:
+        raise ContentValidationError(f"{where}: 'sections' must be a non-empty list")
+
+    front_matter = {key: value for key, value in front_matter.items() if isinstance(value, (str, int, float, bool, list))}
+    front_matter["title"] = _require_string(front_matter, "title", where)
+    front_matter["description"] = _require_string(front_matter, "description", where)
+    return {
+        "slug": entry["slug"],
+        "front_matter": front_matter,
+        "sections": [{"heading": _require_string(section, "heading", f"{where} section {index}"),
+                      "body": _require_string(section, "body", f"{where} section {index}")}
+                     for index, section in enumerate(sections)],
+    }
+
+def parse_markdown_page(entry, text):
+    """
+    Return a page built from the Markdown reply to the streamed page prompt of an outline entry:
+    one section per "## " heading; text before the first heading is headed with the page title.
+    """
+    sections = []
+    heading, lines = entry["title"], []
+    for line in text.splitlines():
+        if line.startswith("## "):
+            if "\n".join(lines).strip():
+                sections.append({"heading": heading, "body": "\n".join(lines).strip()})
+            heading, lines = line[3:].strip() or entry["title"], []
+        elif not line.startswith("# "):
+            lines.append(line)
+    if "\n".join(lines).strip():
+        sections.append({"heading": heading, "body": "\n".join(lines).strip()})
+    if not sections:
+        raise ContentValidationError(f"page '{entry['slug']}': the streamed reply is empty")
+    return {"slug": entry["slug"], "front_matter": {"title": entry["title"], "description": entry["description"]},
+            "sections": sections}
+
+def parse_reply(response):
+    try:
+        return json.loads(response["message"]["content"])
+    except ValueError as e:
+        raise ContentValidationError(f"reply is not valid JSON: {e}")
+
+class ContentPipeline:
+    def __init__(self, website_name, website_type, website_description="", max_pages=MAX_PAGES,
+                 concurrency=None, retries=RETRIES, use_cache=True):
+        """
+        Generate a site as structured JSON: one outline request listing the pages, then one
+        request per page (front matter and sections), each constrained by a JSON schema through
+        Ollama's `format` option. Pages are validated, retried and cached independently.
+        """
+        self.website_name = website_name
+        self.website_type = website_type
+        self.website_description = website_description
+        self.max_pages = max_pages
+        self.concurrency = concurrency or DEFAULT_NUM_PARALLEL
+        self.retries = retries
+        self.use_cache = use_cache
+
+    def site_context(self):
+        context = f"a {self.website_type} website called '{self.website_name}'"
+        if self.website_description:
+            context += f". Description: {self.website_description}"
+        return context
+
+    def outline_prompt(self):
+        return (f"Plan the pages of {self.site_context()}. Return at most {self.max_pages} pages as JSON. "
+                f"Use the slug '{HOMEPAGE}' for the homepage and short kebab-case slugs for the others "
+                f"(e.g. about, services, contact).")
+
+    def page_prompt(self, entry, outline):
+        others = ", ".join(page["title"] for page in outline if page["slug"] != entry["slug"])
+        return (f"Write the '{entry['title']}' page of {self.site_context()}. Page purpose: {entry['description']}. "
+                f"Other pages of the site: {others or 'none'}. Return JSON with front matter (title and a one-sentence "
+                f"description) and a list of sections, each with a heading and a Markdown body.")
+
+    def markdown_page_prompt(self, entry, outline):
+        """
+        Prompt for a page as plain Markdown, used when the page is streamed into its file.
+        """
+        others = ", ".join(page["title"] for page in outline if page["slug"] != entry["slug"])
+        return (f"Write the '{entry['title']}' page of {self.site_context()}. Page purpose: {entry['description']}. "
+                f"Other pages of the site: {others or 'none'}. Answer in Markdown only: no title, and one "
+                f"'## ' heading per section.")
+
+    @staticmethod
+    def prompt_hash(prompt, schema):
+        """
+        Hash of everything a reply depends on; the same key the response cache uses for the first attempt.
+        """
+        return make_cache_key(DEFAULT_MODEL, [{"role": "user", "content": prompt}], None, schema)
+
+    def page_hash(self, entry, outline):
+        return self.prompt_hash(self.page_prompt(entry, outline), PAGE_SCHEMA)
+
+    def _attempts(self, prompt):
+        # Retries change the seed, so each attempt has its own cache entry and a bad cached
+        # reply is skipped on later runs instead of being retried again
+        for attempt in range(self.retries + 1):
+            options = {"seed": attempt} if attempt else None
+            yield attempt, [{"role": "user", "content": prompt}], options
+
+    def request(self, prompt, schema, validate, use_cache=None):
+        """
+        Ask for a JSON reply matching schema and return validate(reply), retrying invalid replies.
+        """
+        use_cache = self.use_cache if use_cache is None else use_cache
+        error = None
+        for attempt, messages, options in self._attempts(prompt):
+            response = chat_with_ollama(messages, options=options, use_cache=use_cache, format=schema)
+            try:
+                return validate(parse_reply(response))
+            except ContentValidationError as e:
+                error = e
+                print(f"Invalid structured reply (attempt {attempt + 1}/{self.retries + 1}): {e}")
+        raise error
+
+    async def arequest(self, prompt, schema, validate, client=None, use_cache=None):
+        use_cache = self.use_cache if use_cache is None else use_cache
+        error = None
+        for attempt, messages, options in self._attempts(prompt):
+            response = await achat_with_ollama(messages, options=options, use_cache=use_cache,
+                                               client=client, format=schema)
+            try:
+                return validate(parse_reply(response))
+            except ContentValidationError as e:
+                error = e
+                print(f"Invalid structured reply (attempt {attempt + 1}/{self.retries + 1}): {e}")
+        raise error
+
+    def outline(self):
+        with span("content.outline", **{"site.name": self.website_name}):
+            return self.request(self.outline_prompt(), OUTLINE_SCHEMA,
+                                lambda data: validate_outline(data, self.max_pages))
+
+    def generate_page(self, entry, outline, use_cache=None):
+        with span("content.page", **{"site.name": self.website_name, "page.slug": entry["slug"]}):
+            page = self.request(self.page_prompt(entry, outline), PAGE_SCHEMA, lambda data: validate_page(data, entry),
+                                use_cache=use_cache)
+        page["prompt_hash"] = self.page_hash(entry, outline)
+        return page
+
+    async def agenerate_pages(self, entries, outline, refresh=()):
+        """
+        Generate the given outline entries concurrently, at most `concurrency` requests in flight.
+        Pages listed in `refresh` skip the response cache so they get new text.
+        Returns the pages in outline order; pages that keep failing validation are left out.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        client = get_model_manager().async_client()
+
+        async def generate(entry):
+            async with semaphore:
+                with span("content.page", **{"site.name": self.website_name, "page.slug": entry["slug"]}):
+                    page = await self.arequest(self.page_prompt(entry, outline), PAGE_SCHEMA,
+                                               lambda data: validate_page(data, entry), client=client,
+                                               use_cache=False if entry["slug"] in refresh else None)
+                page["prompt_hash"] = self.page_hash(entry, outline)
+                return page
+
+        results = await asyncio.gather(*(generate(entry) for entry in entries), return_exceptions=True)
+        pages = []
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                print(f"Skipping page '{entry['slug']}': {result}")
+            else:
+                pages.append(result)
+        return pages
+
+    def generate(self):
+        """
+        Return the structured content of the site: {"site", "outline", "outline_hash", "pages"}.
+        """
+        with span("content.structured", **{"site.name": self.website_name}):
+            outline = self.outline()
+            pages = asyncio.run(self.agenerate_pages(outline, outline))
+            if not pages:
+                raise ContentValidationError(f"No valid pages generated for {self.website_name}")
+        return self.build_content(outline, pages)
+
+    def stream(self, stack, site_dir, echo=True):
+        """
+        Generate the site's pages as Markdown streamed into their page files as tokens arrive, one
+        page of the outline at a time. Stacks whose page files are not Markdown (Next.js) stream
+        into a spool under STREAM_SPOOL_DIR and get the page rendered once its reply is complete.
+        Hand-edited pages are left alone. Streamed pages are recorded with page_hash, like
+        generated ones: both prompts derive from the same outline entry, so update() treats a
+        streamed page as current until its inputs change. The pages are also merged into the
+        ContentStore for other stacks. Returns the written files.
+        """
+        manifest = ContentManifest(site_dir)
+        outline = self.outline()
+        pages = []
+        for entry in outline:
+            if manifest.is_hand_edited(entry["slug"]):
+                print(f"Keeping hand-edited page {manifest.get_file(entry['slug'])}.")
+                continue
+            page_file = get_page_file(stack, site_dir, entry["slug"])
+            front_matter = {"title": entry["title"], "description": entry["description"]}
+            if page_file.endswith(".md"):
+                target = page_file
+                header = render_page(stack, {"front_matter": front_matter, "sections": []}).rstrip("\n") + "\n\n"
+            else:
+                target = os.path.join(site_dir, STREAM_SPOOL_DIR, f"{entry['slug']}.md")
+                header = ""
+            if echo:
+                print(f"\n# {entry['title']}\n")
+            with span("content.stream", **{"site.name": self.website_name, "page.slug": entry["slug"]}) as current:
+                written = stream_text_to_files(self.markdown_page_prompt(entry, outline), [target], echo=echo,
+                                               use_cache=self.use_cache, header=header)
+                current.set(**{"io.bytes": written})
+            with open(target, 'r', encoding='utf-8') as file:
+                text = file.read()[len(header):]
+            if target != page_file:
+                os.remove(target)
+            try:
+                page = parse_markdown_page(entry, text)
+            except ContentValidationError as e:
+                print(f"Skipping page '{entry['slug']}': {e}")
+                continue
+            page["prompt_hash"] = self.page_hash(entry, outline)
+            pages.append(page)
+
+        try:
+            os.rmdir(os.path.join(site_dir, STREAM_SPOOL_DIR))
+        except OSError:
+            pass
+        # Re-render the streamed pages so they match write_content's output and enter the manifest
+        content = self.build_content(outline, pages)
+        add_page_images(stack, site_dir, content)
+        files = write_pages(stack, site_dir, content)
+        ContentStore().merge_pages(self.website_name, content,
+                                   {entry["slug"]: self.page_hash(entry, outline) for entry in outline})
+        return files
+
+    def shared_content(self, store=None):
+        """
+        Return the stack-neutral content of the site. The copy stored by an earlier run is reused
+        while its outline and every page prompt still match; otherwise the content is generated
+        and stored. Rendering it for any number of stacks then costs no further LLM calls.
+        """
+        store = store or ContentStore()
+        content = store.load(self.website_name)
+        if content and self.is_current(content):
+            print(f"Reusing the stored content of {self.website_name} ({len(content['pages'])} pages).")
+            return content
+        content = self.generate()
+        store.save(self.website_name, content)
+        return content
+
+    def is_current(self, content):
+        """
+        Return True if content was generated from the same inputs and has every page of its outline.
+        """
+        if content.get("outline_hash") != self.prompt_hash(self.outline_prompt(), OUTLINE_SCHEMA):
+            return False
+        hashes = {page["slug"]: page.get("prompt_hash") for page in content.get("pages", [])}
+        return all(hashes.get(entry["slug"]) == self.page_hash(entry, content["outline"]) for entry in content["outline"])
+
+    def build_content(self, outline, pages):
+        return {
+            "site": {"name": self.website_name, "type": self.website_type, "description": self.website_description},
+            "outline": outline,
+            "outline_hash": self.prompt_hash(self.outline_prompt(), OUTLINE_SCHEMA),
+            "pages": pages,
+        }
+
+    def update(self, stack, site_dir, targets=(), force=False):
+        """
+        Regenerate only the pages of an existing site that need it: pages whose prompt changed,
+        pages missing from the site, and pages listed in `targets` (which get new text).
+        Pages edited by hand since they were generated are kept unless force=True.
+        The outline is reused from the site's manifest while its prompt is unchanged.
+        Returns {"written": [...], "unchanged": [...], "preserved": [...], "failed": [...]} (page slugs).
+        """
+        manifest = ContentManifest(site_dir)
+        outline_hash = self.prompt_hash(self.outline_prompt(), OUTLINE_SCHEMA)
+        if manifest.outline and manifest.outline_hash == outline_hash:
+            outline = manifest.outline
+        else:
+            outline = self.outline()
+
+        unknown = set(targets) - {entry["slug"] for entry in outline}
+        if unknown:
+            print(f"Unknown page(s) for {self.website_name}: {', '.join(sorted(unknown))}")
+
+        report = {"written": [], "unchanged": [], "preserved": [], "failed": []}
+        stale = []
+        for entry in outline:
+            slug = entry["slug"]
+            if manifest.is_hand_edited(slug) and not force:
+                report["preserved"].append(slug)
+            elif slug in targets or manifest.needs_update(slug, self.page_hash(entry, outline)):
+                stale.append(entry)
+            else:
+                report["unchanged"].append(slug)
+
+        with span("content.update", **{"site.name": self.website_name, "content.pages": len(stale)}):
+            pages = asyncio.run(self.agenerate_pages(stale, outline, refresh=set(targets))) if stale else []
+        written = {page["slug"] for page in pages}
+        report["failed"] = [entry["slug"] for entry in stale if entry["slug"] not in written]
+
+        content = self.build_content(outline, pages)
+        add_page_images(stack, site_dir, content)  # Same image step as a full write
+        write_pages(stack, site_dir, content, force=force)
+        ContentStore().merge_pages(self.website_name, content,
+                                   {entry["slug"]: self.page_hash(entry, outline) for entry in outline})
+        report["written"] = [page["slug"] for page in pages]
+        for slug in report["preserved"]:
+            print(f"Keeping hand-edited page '{slug}' ({manifest.get_file(slug)}); pass force to overwrite it.")
+        print(f"Updated {len(report['written'])} page(s) of the {stack} site {self.website_name} "
+              f"({len(report['unchanged'])} unchanged, {len(report['preserved'])} hand-edited, {len(report['failed'])} failed).")
+        return report
+
+def write_pages(stack, site_dir, content, force=False):
+    """
+    Write the pages of the structured content into the site, recording their prompt and output
+    hashes in the site's content manifest. Pages edited by hand since they were generated are
+    skipped unless force=True. Returns the written files.
+    """
+    manifest = ContentManifest(site_dir)
+    written = []
+    for page in content["pages"]:
+        if manifest.is_hand_edited(page["slug"]) and not force:
+            print(f"Keeping hand-edited page {manifest.get_file(page['slug'])}.")
+            continue
+        page_file = get_page_file(stack, site_dir, page["slug"])
+        rendered = render_page(stack, page)
+        os.makedirs(os.path.dirname(page_file), exist_ok=True)
+        atomic_write(page_file, rendered)
+        manifest.record(page["slug"], page_file, page.get("prompt_hash"), rendered)
+        written.append(page_file)
+
+    if content.get("outline"):
+        manifest.outline = content["outline"]
+        manifest.outline_hash = content.get("outline_hash")
+    manifest.save()
+    return written
@@ -0,0 +1,57 @@
+import json
+import os
+from config_editor import atomic_write
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Stack-neutral content of every site, shared by all of its stacks
+CONTENT_DIR = os.path.join(BASE_DIR, ".content")
+
+class ContentStore:
+    def __init__(self, content_dir=CONTENT_DIR):
+        """
+        Store of the intermediate representation of each site's generated content:
+        {"site", "outline", "outline_hash", "pages": [{"slug", "prompt_hash", "front_matter", "sections"}]}.
+        It is independent of any stack, so rendering it for another stack needs no LLM call.
+        """
+        self.content_dir = content_dir
+
+    @staticmethod
+    def site_key(website_name):
+        # Same naming as Website directories
+        return website_name.lower().replace(" ", "-")
+
+    def get_content_file(self, website_name):
+        return os.path.join(self.content_dir, f"{self.site_key(website_name)}.json")
+
+    def load(self, website_name):
+        try:
+            with open(self.get_content_file(website_name), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, website_name, content):
+        os.makedirs(self.content_dir, exist_ok=True)
+        atomic_write(self.get_content_file(website_name), json.dumps(content, indent=2, ensure_ascii=False) + "\n")
+
+    def merge_pages(self, website_name, content, prompt_hashes):
+        """
+        Store updated pages on top of the stored content. Stored pages that are not part of the
+        update are kept only while their prompt hash still matches `prompt_hashes` (slug -> hash).
+        """
+        stored = self.load(website_name) or {}
+        updated = {page["slug"]: page for page in content["pages"]}
+        pages = []
+        for entry in content["outline"]:
+            slug = entry["slug"]
+            if slug in updated:
+                pages.append(updated[slug])
+                continue
+            previous = next((page for page in stored.get("pages", []) if page["slug"] == slug), None)
+            if previous and previous.get("prompt_hash") == prompt_hashes.get(slug):
+                pages.append(previous)
+        merged = dict(content, pages=pages)
+        self.save(website_name, merged)
+        return merged
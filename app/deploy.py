@@ -0,0 +1,93 @@
+import contextvars
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.tracing import traced, traced_run
+
+# Number of containers started at the same time
+DEFAULT_PARALLEL_STARTS = int(os.environ.get("DEPLOY_PARALLEL_STARTS", 8))
+
+def compose_command(compose_file, *args):
+    return ["docker-compose", "-f", compose_file, *args]
+
+def running_services(compose_file):
+    """
+    Return the names of the services of the compose project whose containers are running.
+    """
+    result = subprocess.run(compose_command(compose_file, "ps", "--services", "--filter", "status=running"),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return set()
+    return {line.strip() for line in result.stdout.splitlines() if line.strip()}
+
+@traced("deploy")
+def deploy(compose_file, services=None, parallel=None, remove_orphans=True):
+    """
+    Deploy the compose project with a single reconciliation, then start containers in parallel.
+
+    `docker-compose up --no-start` creates or recreates the containers of the target services
+    (all services when `services` is None) in one pass; each container is then started with its
+    own `docker-compose start`, at most `parallel` at a time, so every service gets its own timing.
+    Returns {service: {"status": ..., "duration": ...}}.
+    """
+    if services is not None and not services:
+        print("Nothing to deploy.")
+        return {}
+
+    targets = list(services or [])
+    up_args = ["up", "--no-start"] + (["--remove-orphans"] if remove_orphans else []) + targets
+    started = time.time()
+    result = traced_run("deploy.reconcile", compose_command(compose_file, *up_args))
+    reconcile_duration = round(time.time() - started, 3)
+    if result.returncode != 0:
+        print(f"docker-compose up failed with exit code {result.returncode}")
+        return {service: {"status": "failed", "duration": reconcile_duration} for service in targets}
+
+    if services is None:
+        listing = subprocess.run(compose_command(compose_file, "config", "--services"), capture_output=True, text=True)
+        targets = [line.strip() for line in listing.stdout.splitlines() if line.strip()]
+
+    def start(service):
+        service_started = time.time()
+        outcome = traced_run("deploy.start", compose_command(compose_file, "start", service), capture_output=True, text=True)
+        return service, {
+            "status": "ok" if outcome.returncode == 0 else "failed",
+            "duration": round(time.time() - service_started, 3),
+            "error": outcome.stderr.strip() if outcome.returncode != 0 else None,
+        }
+
+    with ThreadPoolExecutor(max_workers=parallel or DEFAULT_PARALLEL_STARTS) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, start, service) for service in targets]
+        timings = dict(future.result() for future in futures)
+
+    print(f"Reconciled {len(targets)} service(s) in {reconcile_duration}s")
+    print_timings(timings)
+    return timings
+
+def remove_services(services):
+    """
+    Stop and remove the containers of services that were dropped from the compose file.
+    Generated services name their container '<service>_container'.
+    """
+    for service in services:
+        print(f"Removing container of {service}")
+        subprocess.run(["docker", "rm", "-f", f"{service}_container"], capture_output=True)
+
+def restart_services(compose_file, services):
+    """
+    Restart the containers of services whose files changed but whose definition did not.
+    """
+    for service in services:
+        print(f"Restarting container of {service}")
+        traced_run("deploy.restart", compose_command(compose_file, "restart", service), capture_output=True)
+
+def print_timings(timings):
+    """
+    Print a per-service timing table.
+    """
+    if not timings:
+        return
+    width = max(len(service) for service in timings)
+    for service, timing in sorted(timings.items(), key=lambda item: item[1]["duration"], reverse=True):
+        print(f"  {service:<{width}}  {timing['status']:<6}  {timing['duration']:.3f}s")
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config_editor import atomic_write
+from utils.craiyon_client import download_image, generate_image_with_craiyon
+from utils.tracing import span
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:  # Pillow is optional; without it only the original image is published
+    Image = None
+    UnidentifiedImageError = OSError
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Content-addressed store of generated images and their variants
+IMAGE_STORE_DIR = os.path.join(BASE_DIR, ".cache", "images")
+
+# Image generations in flight at the same time (the GPU service handles few at once)
+MAX_CONCURRENCY = int(os.environ.get("CRAIYON_MAX_CONCURRENCY", 2))
+
+# Widths of the WebP variants written next to the original
+VARIANT_WIDTHS = tuple(int(width) for width in os.environ.get("IMAGE_VARIANT_WIDTHS", "480,960,1600").split(",") if width)
+
+# Directory served at the site root, per stack
+STATIC_DIRS = {"hugo": "static", "next.js": "public"}
+
+EXTENSIONS = {"image/webp": ".webp", "image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif"}
+
+def images_enabled():
+    """
+    Return True when image generation is turned on through SITE_IMAGES=1.
+    """
+    return os.environ.get("SITE_IMAGES", "0").lower() in ("1", "true", "yes")
+
+class _HashingWriter:
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        self.file.write(chunk)
+
+class ImageStore:
+    def __init__(self, store_dir=IMAGE_STORE_DIR):
+        """
+        Content-addressed image store. Blobs are named by the sha256 of their bytes; a prompt
+        index maps each prompt to the blobs generated for it, so a prompt is only generated once.
+        """
+        self.store_dir = store_dir
+        self.blob_dir = os.path.join(store_dir, "blobs")
+        self.prompt_dir = os.path.join(store_dir, "prompts")
+
+    @staticmethod
+    def prompt_key(prompt):
+        return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt):
+        try:
+            with open(os.path.join(self.prompt_dir, f"{self.prompt_key(prompt)}.json"), 'r') as file:
+                blobs = json.load(file)["blobs"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        paths = [os.path.join(self.blob_dir, blob) for blob in blobs]
+        return paths if paths and all(os.path.exists(path) for path in paths) else None
+
+    def remember(self, prompt, paths):
+        os.makedirs(self.prompt_dir, exist_ok=True)
+        atomic_write(os.path.join(self.prompt_dir, f"{self.prompt_key(prompt)}.json"),
+                     json.dumps({"prompt": prompt, "blobs": [os.path.basename(path) for path in paths]}))
+
+    def fetch(self, url):
+        """
+        Stream an image into the store and return its blob path. Identical bytes share one blob.
+        """
+        os.makedirs(self.blob_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                writer = _HashingWriter(file)
+                content_type = download_image(url, writer)
+            extension = EXTENSIONS.get(content_type.split(";")[0].strip()) or os.path.splitext(url)[1] or ".img"
+            blob_path = os.path.join(self.blob_dir, writer.digest.hexdigest() + extension)
+            if os.path.exists(blob_path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob_path)
+            return blob_path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def variants(self, blob_path, widths=VARIANT_WIDTHS):
+        """
+        Return {width: path} of WebP variants of a blob, creating missing ones. Variants are never
+        wider than the original. Without Pillow the original is the only variant.
+        """
+        digest, extension = os.path.splitext(os.path.basename(blob_path))
+        if Image is None:
+            return {None: blob_path}
+        variant_dir = os.path.join(self.store_dir, "variants")
+        os.makedirs(variant_dir, exist_ok=True)
+        variants = {}
+        with Image.open(blob_path) as image:
+            for width in sorted(set(min(width, image.width) for width in widths)):
+                path = os.path.join(variant_dir, f"{digest}-{width}.webp")
+                if not os.path.exists(path):
+                    height = round(image.height * width / image.width)
+                    resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                    fd, tmp_path = tempfile.mkstemp(dir=variant_dir, suffix=".webp")
+                    with os.fdopen(fd, 'wb') as file:
+                        resized.convert("RGB").save(file, "WEBP", quality=80, method=4)
+                    os.replace(tmp_path, path)
+                variants[width] = path
+        return variants
+
+class ImagePipeline:
+    def __init__(self, store=None, max_concurrency=MAX_CONCURRENCY, images_per_prompt=1):
+        """
+        Generate page images through one Craiyon client with at most `max_concurrency`
+        generations in flight. Identical prompts are generated once: across runs through the
+        store's prompt index, and within a run by sharing the in-flight request.
+        """
+        self.store = store or ImageStore()
+        self.images_per_prompt = images_per_prompt
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._in_flight = {}
+        self._lock = threading.RLock()  # Done callbacks of already finished futures run while it is held
+
+    def submit(self, prompt):
+        """
+        Queue a prompt and return a future resolving to the blob paths of its images.
+        """
+        key = ImageStore.prompt_key(prompt)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self.executor.submit(self._generate, prompt)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done: self._forget(key))
+            return future
+
+    def _forget(self, key):
+        # Finished prompts are found in the store from now on
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _generate(self, prompt):
+        cached = self.store.lookup(prompt)
+        if cached:
+            return cached
+        with span("image.generate", **{"image.prompt_chars": len(prompt)}) as current:
+            urls = generate_image_with_craiyon(prompt)[:self.images_per_prompt]
+            paths = [self.store.fetch(url) for url in urls]
+            current.set(**{"io.bytes": sum(os.path.getsize(path) for path in paths)})
+        self.store.remember(prompt, paths)
+        return paths
+
+    @staticmethod
+    def page_prompt(site, page):
+        return (f"{page['front_matter']['title']} - {page['front_matter']['description']} "
+                f"(illustration for the {site.get('type', 'website')} website {site.get('name', '')})").strip()
+
+    def publish(self, stack, site_dir, slug, blob_path):
+        """
+        Link the variants of an image into the site's static directory and return the page's
+        image record: {"src", "srcset", "width"} with root-relative URLs.
+        """
+        target_dir = os.path.join(site_dir, STATIC_DIRS[stack], "images", slug)
+        os.makedirs(target_dir, exist_ok=True)
+        urls = {}
+        for width, path in self.store.variants(blob_path).items():
+            name = os.path.basename(path)
+            target = os.path.join(target_dir, name)
+            if not os.path.exists(target):
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copyfile(path, target)
+            urls[width] = f"/images/{slug}/{name}"
+
+        widths = sorted(width for width in urls if width)
+        if not widths:
+            return {"src": urls[None]}
+        default = next((width for width in widths if width >= 960), widths[-1])
+        return {"src": urls[default], "srcset": ", ".join(f"{urls[width]} {width}w" for width in widths), "width": default}
+
+    def add_images(self, stack, site_dir, content):
+        """
+        Generate (or reuse) one image per page, publish it into the site and set page["image"].
+        A page whose image fails to generate or publish is left without one.
+        Returns the number of pages that got an image.
+        """
+        futures = {page["slug"]: self.submit(self.page_prompt(content.get("site", {}), page)) for page in content["pages"]}
+        added = 0
+        for page in content["pages"]:
+            try:
+                paths = futures[page["slug"]].result()
+            except Exception as e:
+                print(f"Image generation failed for page '{page['slug']}': {e}")
+                continue
+            if not paths:
+                continue
+            try:
+                page["image"] = dict(self.publish(stack, site_dir, page["slug"], paths[0]), alt=page["front_matter"]["title"])
+            except (OSError, ValueError, UnidentifiedImageError) as e:
+                # An image that cannot be decoded or written only costs its page the image
+                print(f"Cannot publish the image of page '{page['slug']}': {e}")
+                continue
+            added += 1
+        return added
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+_default_pipeline = None
+_default_lock = threading.Lock()
+
+def get_image_pipeline():
+    """
+    Return the process-wide image pipeline, so every stack and site of a run shares its
+    concurrency limit and in-flight deduplication.
+    """
+    global _default_pipeline
+    with _default_lock:
+        if _default_pipeline is None:
+            _default_pipeline = ImagePipeline()
+        return _default_pipeline
+
+def add_page_images(stack, site_dir, content):
+    """
+    Add images to the pages of the content through the shared pipeline when SITE_IMAGES is on.
+    Returns the number of pages that got an image.
+    """
+    if not images_enabled() or not content["pages"]:
+        return 0
+    count = get_image_pipeline().add_images(stack, site_dir, content)
+    print(f"Added {count} image(s) to the {stack} site {os.path.basename(site_dir)}.")
+    return count
@@ -0,0 +1,19 @@
+import threading
+
+class JobCancelled(Exception):
+    """
+    Raised from a progress callback when the running job was cancelled.
+    """
+
+# One lock per site name, held while a job works on that site's directories
+_site_locks = {}
+_site_locks_guard = threading.Lock()
+
+def site_lock(website_name):
+    """
+    Return the lock of a site, shared by every job of this process that uses the same site name
+    (normalized like Website directories).
+    """
+    key = website_name.lower().replace(" ", "-")
+    with _site_locks_guard:
+        return _site_locks.setdefault(key, threading.Lock())
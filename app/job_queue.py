@@ -0,0 +1,175 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from job_control import JobCancelled
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# SQLite database holding the generation jobs
+JOB_DB_FILE = os.environ.get("JOB_DB_FILE", os.path.join(BASE_DIR, ".jobs", "jobs.sqlite3"))
+
+STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+# Oldest queued job whose site has no running job
+NEXT_JOB_QUERY = """
+    SELECT id FROM jobs
+    WHERE status = 'queued' AND json_extract(params, '$.name') NOT IN (
+        SELECT json_extract(params, '$.name') FROM jobs
+        WHERE status = 'running' AND json_extract(params, '$.name') IS NOT NULL
+    )
+    ORDER BY created_at LIMIT 1
+"""
+
+class JobQueue:
+    def __init__(self, db_file=JOB_DB_FILE):
+        """
+        Persistent FIFO of generation jobs in SQLite. Jobs survive restarts: anything left
+        'running' by a previous process is put back in the queue on startup.
+        """
+        self.db_file = db_file
+        self._available = threading.Condition()
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per operation; WAL lets the API threads read while workers write
+        db = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, params):
+        """
+        Queue a job and return its id.
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, params, created_at) VALUES (?, ?, ?)", (job_id, json.dumps(params), time.time()))
+        with self._available:
+            self._available.notify()
+        return job_id
+
+    def claim(self, timeout=1.0):
+        """
+        Atomically take the oldest queued job and mark it running. Jobs for a site that already
+        has a running job stay queued until it finishes, so two jobs never work on the same site
+        directories at once. Waits up to `timeout` seconds for one to arrive; returns None when
+        the queue stays empty.
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._connect() as db:
+                db.execute("BEGIN IMMEDIATE")
+                row = db.execute(NEXT_JOB_QUERY).fetchone()
+                if row is not None:
+                    db.execute("UPDATE jobs SET status = 'running', started_at = ?, message = 'Started' WHERE id = ?",
+                               (time.time(), row["id"]))
+                db.execute("COMMIT")
+            if row is not None:
+                return self.get(row["id"])
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            # Woken early by submit() in this process; jobs queued by other processes are picked up on the next poll
+            with self._available:
+                self._available.wait(remaining)
+
+    def update_progress(self, job_id, progress, message=None):
+        """
+        Record the progress (0..1) of a running job. Raises JobCancelled if a cancellation was requested.
+        """
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET progress = ?, message = ? WHERE id = ? AND status = 'running'",
+                       (progress, message, job_id))
+            row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is not None and row["cancel_requested"]:
+            raise JobCancelled(job_id)
+
+    def finish(self, job_id, status, result=None, error=None):
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = ?, message = ?, result = ?, error = ?, finished_at = ?, "
+                       "progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END WHERE id = ?",
+                       (status, status.capitalize(), json.dumps(result) if result is not None else None, error,
+                        time.time(), status, job_id))
+        # Queued jobs of the same site can run now
+        with self._available:
+            self._available.notify_all()
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs stop at their next
+        progress checkpoint. Returns the job, or None if it does not exist.
+        """
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ?, message = 'Cancelled' "
+                       "WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._connect() as db:
+            return self._to_dict(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list(self, status=None, limit=100):
+        query = "SELECT * FROM jobs"
+        args = []
+        if status:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._connect() as db:
+            return [self._to_dict(row) for row in db.execute(query, args).fetchall()]
+
+    def counts(self):
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({row["status"]: row["count"] for row in rows})
+        return counts
+
+    def requeue_interrupted(self):
+        """
+        Put jobs that were running when the previous process stopped back in the queue.
+        """
+        with self._connect() as db:
+            cursor = db.execute("UPDATE jobs SET status = 'queued', started_at = NULL, progress = 0, "
+                                "message = 'Requeued after restart' WHERE status = 'running' AND cancel_requested = 0")
+            db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE status = 'running'", (time.time(),))
+        return cursor.rowcount
@@ -1,26 +1,41 @@
+import argparse
 from website import Website
 from theme_manager import ThemeManager
-import ollama
+from scaffolder import ParallelScaffolder, aggregate_exit_status
+from content_pipeline import ContentPipeline
+from utils.model_manager import get_model_manager
+from utils.ollama_client import get_cache_stats
+from utils.tracing import print_summary, span
 
-def generate_website_content(website_name, website_type, website_description=""):
+def generate_website_content(website_name, website_type, website_description="", use_cache=True):
     """
-    Use Ollama to generate full website content based on the website name, type, and description.
+    Use Ollama to generate the website content as structured, stack-neutral pages (see content_pipeline).
+    Content stored by an earlier run with the same inputs is reused, so new stacks only need a local render.
     """
-    prompt = f"Generate all the content for a {website_type} website called '{website_name}'. " \
-             f"Include sections like homepage, about us, services (if applicable), contact us, and any other relevant sections. " \
-             f"Here is the description of the website: {website_description}"
+    with span("content.generate", **{"site.name": website_name}):
+        content = ContentPipeline(website_name, website_type, website_description, use_cache=use_cache).shared_content()
 
-    # Use Ollama to generate the content
-    response = ollama.chat(model="llama3.1", messages=[{"role": "user", "content": prompt}])
-
-    # Extract the generated content
-    content = response["message"]["content"]
     print(f"AI-generated content for {website_name}:")
-    print(content)
+    for page in content["pages"]:
+        print(f"  {page['slug']}: {page['front_matter']['title']} ({len(page['sections'])} sections)")
 
     return content
 
-def main():
+def stream_website_content(website, website_type, website_description, use_cache=True):
+    """
+    Stream the generated content of a website into its page files as tokens arrive, one page at
+    a time, echoing them to the console. Pages go to the same files write_content writes.
+    """
+    print(f"AI-generated content for {website.website_name}:")
+    pipeline = ContentPipeline(website.website_name, website_type, website_description, use_cache=use_cache)
+    with span("content.stream_site", **{"site.name": website.website_name, "site.stack": website.stack}):
+        files = pipeline.stream(website.stack, website.get_website_dir())
+    print(f"Wrote {len(files)} page(s) to the {website.stack} site {website.website_name}.")
+    return files
+
+def main(stream=False):
+    # Load the models while the user answers the prompts, so generation starts warm
+    get_model_manager().start()
     print("Welcome to the Website Generator.")
 
     # Get user input for website details
@@ -37,27 +52,64 @@ def main():
         print("No valid stacks selected. Exiting.")
         return
 
-    # Generate full content using Ollama
-    generated_content = generate_website_content(website_name, website_type, website_description)
+    # Existing sites are updated page by page through the pipeline; new sites get the full content
+    pipeline = ContentPipeline(website_name, website_type, website_description)
+
+    exit_status = 0  # Becomes 1 when a scaffolding job fails
 
-    # Process each selected stack (Hugo, Next.js)
+    # Decide what to do with each selected stack (Hugo, Next.js) before running anything
+    websites = []
+    pending = []  # Websites that need scaffolding
     for stack in stacks:
         print(f"Processing stack: {stack}")
-        website = Website(stack=stack, website_name=website_name, shared_content=generated_content)
+        website = Website(stack=stack, website_name=website_name, shared_content=None)
 
         # Check if the website is already initialized
         if website.is_website_initialized():
             action = input(f"The {stack} website is already initialized. Do you want to 'reset' or 'modify' the {stack} website? ").strip().lower()
             if action == "reset":
-                website.initialize_stack(reset=True)  # Reinitialize the website stack
+                website.prepare_directory(reset=True)  # Reinitialize the website stack
+                pending.append(website)
             elif action == "modify":
+                targets = input("Pages to regenerate (comma-separated slugs, blank for only pages whose inputs changed): ")
                 print(f"Modifying {stack} website with AI-generated content...")
-                website.modify_website()  # Apply the generated content to the website
+                website.modify_website(pipeline, pages=[slug.strip() for slug in targets.split(",") if slug.strip()])
             else:
                 print(f"Unknown action: {action} for {stack}. Skipping.")
                 continue
+        elif website.prepare_directory():
+            pending.append(website)  # Initialize the website stack with generated content
         else:
-            website.initialize_stack()  # Initialize the website stack with generated content
+            continue
+        websites.append(website)
+
+    # Scaffold every new or reset stack at the same time; a failed stack does not stop the others
+    if pending:
+        scaffolder = ParallelScaffolder()
+        jobs = [scaffolder.submit(website) for website in pending]
+
+        # Generate the content once for all new stacks while they are being scaffolded. In streaming
+        # mode the content is written into each site instead; later stacks replay the first stream.
+        if not stream:
+            generated_content = generate_website_content(website_name, website_type, website_description)
+            for website in pending:
+                website.shared_content = generated_content
+
+        results = [job.result() for job in jobs]
+        scaffolder.shutdown()
+        exit_status = aggregate_exit_status(results)
+        failed = {(result["stack"], result["name"]) for result in results if result["status"] == "failed"}
+        for stack, name in sorted(failed):
+            print(f"Error initializing {stack} for {name}; see its scaffolding log. Skipping.")
+        websites = [website for website in websites if (website.stack, website.website_name) not in failed]
+
+    for website in websites:
+        stack = website.stack
+        if website in pending:
+            if stream:
+                stream_website_content(website, website_type, website_description)
+            else:
+                website.write_content()
 
         # Theme management options
         theme_manager = ThemeManager(stack, website.website_name)
@@ -66,10 +118,19 @@ def main():
         manage_theme = input(f"Would you like to change the theme for {stack}? (yes/no): (current theme: {current_theme}) ").strip().lower()
         if manage_theme == "yes":
             new_theme = input(f"Please enter the new theme for {stack}: ").strip()
-            theme_manager.initialize_theme(new_theme)
-            theme_manager.change_theme(new_theme)
+            with span("theme", **{"site.stack": stack, "theme.name": new_theme}):
+                theme_manager.initialize_theme(new_theme)
+                theme_manager.change_theme(new_theme)
 
+    stats = get_cache_stats()
+    print(f"Ollama cache: {stats['hits']} hits, {stats['misses']} misses.")
+    get_model_manager().print_latency()
+    print_summary()
     print("Website generation complete.")
+    return exit_status
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Interactive website generator.")
+    parser.add_argument("--stream", action="store_true", help="Stream generated content into the site files as it is produced")
+    args = parser.parse_args()
+    raise SystemExit(main(stream=args.stream))
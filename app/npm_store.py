@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from utils.tracing import traced_run
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# npm's content-addressed tarball cache, shared by every site
+NPM_CACHE_DIR = os.path.join(BASE_DIR, ".cache", "npm")
+
+# Resolved package.json/package-lock.json pairs, keyed by install inputs
+LOCKFILE_DIR = os.path.join(BASE_DIR, ".cache", "lockfiles")
+
+def npm_env(base_env=None):
+    """
+    Return an environment pointing npm at the shared cache and preferring cached packages.
+    """
+    env = dict(base_env if base_env is not None else os.environ)
+    env.update({
+        "npm_config_cache": NPM_CACHE_DIR,
+        "npm_config_prefer_offline": "true",
+        "npm_config_audit": "false",
+        "npm_config_fund": "false",
+        "npm_config_update_notifier": "false",
+    })
+    return env
+
+class NpmStore:
+    def __init__(self, lockfile_dir=LOCKFILE_DIR):
+        """
+        Shared npm package store. Tarballs live in one npm cache; the lockfile produced by an
+        install is stored under a key of its inputs, so the same install in another site is
+        replayed with `npm ci --offline` and skips dependency resolution entirely.
+        """
+        self.lockfile_dir = lockfile_dir
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def _strip_names(data):
+        # Site names differ between otherwise identical installs
+        data = json.loads(json.dumps(data))
+        data.pop("name", None)
+        data.get("packages", {}).get("", {}).pop("name", None)
+        return data
+
+    def install_key(self, site_dir, packages):
+        """
+        Hash the site's dependency manifest, its lockfile and the requested packages.
+        """
+        package = self._strip_names(self._read_json(os.path.join(site_dir, "package.json")))
+        lock = self._strip_names(self._read_json(os.path.join(site_dir, "package-lock.json")))
+        payload = json.dumps({"package": package, "lock": lock, "install": sorted(packages)}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def install(self, site_dir, packages=()):
+        """
+        Install packages into the site (or its declared dependencies when none are given).
+        Returns "replayed" when a stored lockfile was used, "resolved" otherwise.
+        """
+        key = self.install_key(site_dir, packages)
+        stored_dir = os.path.join(self.lockfile_dir, key)
+        name = self._read_json(os.path.join(site_dir, "package.json")).get("name")
+
+        if os.path.exists(os.path.join(stored_dir, "package-lock.json")):
+            for filename in ("package.json", "package-lock.json"):
+                self._copy_with_name(os.path.join(stored_dir, filename), os.path.join(site_dir, filename), name)
+            try:
+                traced_run("npm.ci", ["npm", "ci", "--offline"], cwd=site_dir, env=npm_env(), check=True)
+            except subprocess.CalledProcessError:
+                # The shared cache was pruned; fetch what is missing but keep the stored resolution
+                traced_run("npm.ci", ["npm", "ci"], cwd=site_dir, env=npm_env(), check=True)
+            return "replayed"
+
+        traced_run("npm.install", ["npm", "install", *packages], cwd=site_dir, env=npm_env(), check=True)
+        os.makedirs(stored_dir, exist_ok=True)
+        for filename in ("package.json", "package-lock.json"):
+            source = os.path.join(site_dir, filename)
+            if os.path.exists(source):
+                shutil.copyfile(source, os.path.join(stored_dir, filename))
+        return "resolved"
+
+    @staticmethod
+    def _copy_with_name(source, destination, name):
+        with open(source, 'r') as file:
+            data = json.load(file)
+        if name:
+            data["name"] = name
+            if "" in data.get("packages", {}):
+                data["packages"][""]["name"] = name
+        with open(destination, 'w') as file:
+            json.dump(data, file, indent=2)
+            file.write("\n")
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+
+# Default ports for different stacks
+DEFAULT_PORTS = {
+    "hugo": 1313,
+    "next.js": 3000
+}
+
+# Port range start for stacks without a default
+FALLBACK_PORT = 8000
+
+class PortLedger:
+    def __init__(self, ledger_file):
+        """
+        Persistent service -> port assignments. A service keeps its port for as long as it exists,
+        so adding or removing a site never shifts the ports of the others.
+
+        Allocation is O(1): released ports go to a per-stack free list that is reused first,
+        otherwise the per-stack cursor hands out the next port that is not already taken.
+        """
+        self.ledger_file = ledger_file
+        self.assignments = {}  # service name -> {"stack": ..., "port": ...}
+        self.free = {}  # stack -> released ports
+        self.next_port = {}  # stack -> next never-used candidate port
+        self.used = set()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.ledger_file, 'r') as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        self.assignments = data.get("assignments", {})
+        self.free = data.get("free", {})
+        self.next_port = data.get("next_port", {})
+        self.used = {assignment["port"] for assignment in self.assignments.values()}
+
+    def save(self):
+        directory = os.path.dirname(self.ledger_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w') as file:
+            json.dump({"assignments": self.assignments, "free": self.free, "next_port": self.next_port}, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.ledger_file)
+
+    def allocate(self, service, stack):
+        """
+        Return the port of a service, assigning a new one if the service is not in the ledger yet.
+        """
+        assignment = self.assignments.get(service)
+        if assignment is not None:
+            return assignment["port"]
+
+        free_ports = self.free.get(stack)
+        while free_ports:
+            port = free_ports.pop()
+            if port not in self.used:
+                break
+        else:
+            # Every candidate is skipped at most once, so this is amortised O(1)
+            port = self.next_port.get(stack, DEFAULT_PORTS.get(stack, FALLBACK_PORT))
+            while port in self.used:
+                port += 1
+            self.next_port[stack] = port + 1
+
+        self.assignments[service] = {"stack": stack, "port": port}
+        self.used.add(port)
+        return port
+
+    def release(self, service):
+        """
+        Return a removed service's port to its stack's free list.
+        """
+        assignment = self.assignments.pop(service, None)
+        if assignment is None:
+            return
+        self.used.discard(assignment["port"])
+        self.free.setdefault(assignment["stack"], []).append(assignment["port"])
+
+    def sync(self, services):
+        """
+        Make the ledger match a {service name: stack} mapping and persist it.
+        Returns the {service name: port} mapping.
+        """
+        for service in list(self.assignments):
+            if service not in services:
+                self.release(service)
+        ports = {service: self.allocate(service, stack) for service, stack in services.items()}
+        self.save()
+        return ports
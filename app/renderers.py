@@ -0,0 +1,96 @@
+import json
+import os
+import yaml
+
+# Slug of the page rendered as the site's homepage
+HOMEPAGE = "index"
+
+class HugoRenderer:
+    """
+    Renders pages as Hugo Markdown with YAML front matter under content/.
+    """
+    def get_page_file(self, site_dir, slug):
+        filename = "_index.md" if slug == HOMEPAGE else f"{slug}.md"
+        return os.path.join(site_dir, "content", filename)
+
+    def render_body(self, page):
+        blocks = [f"## {section['heading']}\n\n{section['body'].strip()}" for section in page["sections"]]
+        if page.get("image"):
+            blocks.insert(0, f"![{page['image']['alt']}]({page['image']['src']})")
+        return "\n\n".join(blocks) + "\n"
+
+    def render(self, page):
+        front_matter = dict(page["front_matter"])
+        if page.get("image"):
+            front_matter["images"] = [page["image"]["src"]]  # Used by Hugo's OpenGraph/Twitter card templates
+        front_matter = yaml.safe_dump(front_matter, sort_keys=False, allow_unicode=True, width=1000)
+        return f"---\n{front_matter}---\n\n{self.render_body(page)}"
+
+class NextjsRenderer:
+    """
+    Renders pages as Next.js App Router pages under app/ (or src/app/). The content is embedded
+    as JSON data rather than JSX text, so generated prose never needs escaping.
+    """
+    def get_page_file(self, site_dir, slug):
+        app_dir = os.path.join(site_dir, "app")
+        if not os.path.isdir(app_dir) and os.path.isdir(os.path.join(site_dir, "src", "app")):
+            app_dir = os.path.join(site_dir, "src", "app")
+        page_dir = app_dir if slug == HOMEPAGE else os.path.join(app_dir, slug)
+        # Keep the extension of an existing page (e.g. the starter page.tsx) instead of adding a second one
+        for filename in ("page.tsx", "page.jsx", "page.js"):
+            if os.path.exists(os.path.join(page_dir, filename)):
+                return os.path.join(page_dir, filename)
+        return os.path.join(page_dir, "page.js")
+
+    def render(self, page):
+        data = json.dumps({"title": page["front_matter"]["title"], "description": page["front_matter"]["description"],
+                           "image": page.get("image"), "sections": page["sections"]}, indent=2, ensure_ascii=False)
+        return f"""// Generated by website-generator from structured content.
+const page = {data};
+
+export const metadata = {{ title: page.title, description: page.description }};
+
+export default function Page() {{
+  return (
+    <main>
+      <h1>{{page.title}}</h1>
+      {{page.image && (
+        <img src={{page.image.src}} srcSet={{page.image.srcset}} sizes="100vw" alt={{page.image.alt}} />
+      )}}
+      {{page.sections.map((section) => (
+        <section key={{section.heading}}>
+          <h2>{{section.heading}}</h2>
+          {{section.body.split(/\\n{{2,}}/).map((paragraph, index) => (
+            <p key={{index}}>{{paragraph}}</p>
+          ))}}
+        </section>
+      ))}}
+    </main>
+  );
+}}
+"""
+
+# One renderer per stack; a new stack only needs a renderer to reuse generated content
+RENDERERS = {
+    "hugo": HugoRenderer(),
+    "next.js": NextjsRenderer(),
+}
+
+def register_renderer(stack, renderer):
+    RENDERERS[stack] = renderer
+
+def get_renderer(stack):
+    try:
+        return RENDERERS[stack]
+    except KeyError:
+        raise ValueError(f"Unsupported stack: {stack}")
+
+def get_page_file(stack, site_dir, slug):
+    """
+    Return the file a page is written to: content/<slug>.md for Hugo (content/_index.md for the
+    homepage) and app/<slug>/page.js for Next.js (app/page.js for the homepage).
+    """
+    return get_renderer(stack).get_page_file(site_dir, slug)
+
+def render_page(stack, page):
+    return get_renderer(stack).render(page)
@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from npm_store import npm_env
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Pristine, pre-built skeletons (one per stack) that new sites are cloned from
+TEMPLATE_DIR = os.path.join(BASE_DIR, ".templates")
+
+# Bump to rebuild every template, e.g. after changing how templates are scaffolded
+TEMPLATE_VERSION = 1
+
+# Templates older than this many seconds are rebuilt, so new sites pick up new tool and dependency versions
+TEMPLATE_MAX_AGE = int(os.environ.get("SCAFFOLD_TEMPLATE_MAX_AGE", 7 * 24 * 3600))
+
+_build_locks = {"hugo": threading.Lock(), "next.js": threading.Lock()}
+
+def templates_enabled():
+    """
+    Return False when template cloning is disabled through SCAFFOLD_USE_TEMPLATES=0.
+    """
+    return os.environ.get("SCAFFOLD_USE_TEMPLATES", "1").lower() not in ("0", "false", "no")
+
+def scaffold_command(stack, target_dir):
+    """
+    Return the command that scaffolds a new site for the stack into target_dir.
+    """
+    if stack == "hugo":
+        return ["hugo", "new", "site", target_dir]
+    elif stack == "next.js":
+        return ["npx", "create-next-app", target_dir]
+    else:
+        raise ValueError(f"Unsupported stack: {stack}")
+
+class TemplateStore:
+    def __init__(self, template_dir=TEMPLATE_DIR):
+        """
+        Store of scaffold templates. Each stack is scaffolded once with its real tool;
+        new sites are copied out of it instead of re-running hugo/npx.
+        """
+        self.template_dir = template_dir
+
+    def get_template_path(self, stack):
+        return os.path.join(self.template_dir, stack)
+
+    def get_stamp_file(self, stack):
+        # Kept next to the template rather than inside it, so it is never cloned into sites
+        return f"{self.get_template_path(stack)}.json"
+
+    def has_template(self, stack):
+        return os.path.isdir(self.get_template_path(stack))
+
+    def is_current(self, stack, max_age=TEMPLATE_MAX_AGE):
+        """
+        Return True if the stack's template exists, was built by this TEMPLATE_VERSION and is
+        younger than max_age seconds.
+        """
+        if not self.has_template(stack):
+            return False
+        try:
+            with open(self.get_stamp_file(stack), 'r') as file:
+                stamp = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return False
+        return stamp.get("version") == TEMPLATE_VERSION and time.time() - stamp.get("built_at", 0) < max_age
+
+    def build_template(self, stack, rebuild=False, log=None):
+        """
+        Scaffold the pristine template for a stack if it is missing or stale and return its path.
+        The template is built in a temporary directory and renamed into place, so a failed or
+        concurrent build never leaves a half-written template behind. The output of hugo/npx goes
+        to `log` (an open file) when given, otherwise to the console.
+        """
+        template_path = self.get_template_path(stack)
+        with _build_locks.setdefault(stack, threading.Lock()):
+            if self.is_current(stack) and not rebuild:
+                return template_path
+
+            os.makedirs(self.template_dir, exist_ok=True)
+            build_path = f"{template_path}.building"
+            shutil.rmtree(build_path, ignore_errors=True)
+            command = scaffold_command(stack, build_path)
+            print(f"Building {stack} scaffold template at {template_path}...")
+            if log is not None:
+                log.write(f"$ {' '.join(command)}\n")
+                log.flush()
+            subprocess.run(command, check=True, stdin=subprocess.DEVNULL, env=npm_env(),
+                           stdout=log, stderr=subprocess.STDOUT if log is not None else None)
+
+            shutil.rmtree(template_path, ignore_errors=True)
+            os.rename(build_path, template_path)
+            with open(self.get_stamp_file(stack), 'w') as file:
+                json.dump({"version": TEMPLATE_VERSION, "built_at": time.time()}, file)
+        return template_path
+
+    def clone(self, stack, website_dir, log=None):
+        """
+        Stamp a new site out of the stack template, building the template first if needed (its
+        output goes to `log`). node_modules is reflinked where the filesystem supports it and
+        copied otherwise, so no two sites ever share the same dependency files.
+        """
+        template_path = self.build_template(stack, log=log)
+        os.makedirs(os.path.dirname(website_dir), exist_ok=True)
+
+        shutil.copytree(template_path, website_dir, symlinks=True,
+                        ignore=lambda directory, names: ["node_modules"] if directory == template_path else [])
+
+        node_modules = os.path.join(template_path, "node_modules")
+        if os.path.isdir(node_modules):
+            self.reflink_tree(node_modules, os.path.join(website_dir, "node_modules"))
+
+        if stack == "next.js":
+            self.rename_package(website_dir)
+        print(f"Cloned {stack} template into {website_dir}.")
+        return website_dir
+
+    @staticmethod
+    def reflink_tree(source, destination):
+        """
+        Copy a directory tree with copy-on-write reflinks, falling back to a plain copy.
+        Hardlinks are never used: an `npm install` in one site would modify the shared files
+        of the template and of every other site.
+        """
+        try:
+            subprocess.run(["cp", "-a", "--reflink=always", source, destination],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            shutil.rmtree(destination, ignore_errors=True)
+
+        shutil.copytree(source, destination, symlinks=True)
+
+    @staticmethod
+    def rename_package(website_dir):
+        """
+        create-next-app names the package after its directory; give the clone its own name.
+        """
+        package_file = os.path.join(website_dir, "package.json")
+        if not os.path.exists(package_file):
+            return
+        with open(package_file, 'r') as file:
+            package = json.load(file)
+        package["name"] = os.path.basename(website_dir)
+        with open(package_file, 'w') as file:
+            json.dump(package, file, indent=2)
+            file.write("\n")
@@ -0,0 +1,117 @@
+import contextvars
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from npm_store import npm_env
+from scaffold_templates import templates_enabled
+from utils.tracing import span
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Per-job scaffolding logs
+LOG_DIR = os.path.join(BASE_DIR, ".logs", "scaffold")
+
+# Number of scaffolding commands allowed to run at the same time
+DEFAULT_MAX_WORKERS = int(os.environ.get("SCAFFOLD_MAX_WORKERS", 4))
+
+class ParallelScaffolder:
+    def __init__(self, max_workers=None, log_dir=LOG_DIR, echo=True):
+        """
+        Run the scaffolding command of many websites at once. Every job is its own subprocess,
+        so a thread per job is enough to keep `max_workers` of them busy in parallel.
+        Output of each job is captured line by line into its own log file.
+        """
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self.log_dir = log_dir
+        self.echo = echo
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._print_lock = threading.Lock()
+
+    def scaffold(self, websites, reset=False):
+        """
+        Scaffold every website concurrently and wait for all of them.
+        Returns one result record per website, in the same order.
+        """
+        futures = [self.submit(website, reset=reset) for website in websites]
+        return [future.result() for future in futures]
+
+    def submit(self, website, reset=False):
+        """
+        Queue one website for scaffolding and return a future resolving to its result record.
+        """
+        # Run in a copy of the caller's context so the job's span nests under the caller's
+        return self.executor.submit(contextvars.copy_context().run, self.run_job, website, reset)
+
+    def run_job(self, website, reset=False):
+        """
+        Prepare the directory and run the scaffolding command for one website, never raising.
+        """
+        job_name = f"{website.stack}/{website.website_name}"
+        log_file = os.path.join(self.log_dir, f"{website.stack}-{website.website_name}.log")
+        result = {"stack": website.stack, "name": website.website_name, "log_file": log_file,
+                  "returncode": None, "status": "ok", "duration": 0.0}
+        started = time.time()
+
+        with span("scaffold.job", **{"site.stack": website.stack, "site.name": website.website_name}) as current:
+            try:
+                if website.prepare_directory(reset=reset, interactive=False):
+                    self._run_command(website, job_name, log_file, result)
+                else:
+                    result["status"] = "skipped"
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
+            current.set(**{"scaffold.status": result["status"], "process.exit_code": result["returncode"]})
+            if result["status"] == "failed":
+                current.status = "error"
+        result["duration"] = round(time.time() - started, 3)
+
+        with self._print_lock:
+            print(f"Scaffolding {job_name}: {result['status']} in {result['duration']}s (log: {log_file})")
+        return result
+
+    def _run_command(self, website, job_name, log_file, result):
+        os.makedirs(self.log_dir, exist_ok=True)
+        if templates_enabled():
+            # Cloning from the template is a local copy; only a (re)build of the template runs hugo/npx,
+            # and its output goes to this job's log
+            with open(log_file, "w") as log:
+                log.write(f"Cloning {website.stack} template into {website.get_website_dir()}\n")
+                log.flush()
+                try:
+                    website.scaffold(log=log)
+                except subprocess.CalledProcessError as e:
+                    log.write(f"Template build failed with exit code {e.returncode}\n")
+                    result["returncode"] = e.returncode
+                else:
+                    result["returncode"] = 0
+        else:
+            command = website.get_scaffold_command()
+            with open(log_file, "w") as log:
+                log.write(f"$ {' '.join(command)}\n")
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           stdin=subprocess.DEVNULL, text=True, bufsize=1, env=npm_env())
+                for line in process.stdout:
+                    log.write(line)
+                    log.flush()
+                    if self.echo:
+                        with self._print_lock:
+                            print(f"[{job_name}] {line}", end="")
+                result["returncode"] = process.wait()
+
+        if result["returncode"] != 0:
+            result["status"] = "failed"
+        else:
+            website.get_config_file()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+def aggregate_exit_status(results):
+    """
+    Combine job results into a single process exit status: 0 if every job succeeded or was skipped.
+    """
+    return 0 if all(result["status"] != "failed" for result in results) else 1
@@ -1,56 +1,174 @@
+import argparse
+import hashlib
+import json
 import os
+import tempfile
 import yaml
-import subprocess
+from site_index import SiteIndex
+from port_ledger import PortLedger
+from deploy import deploy, remove_services, running_services
+from static_build import build_sites
+from utils.tracing import print_summary, traced
 
 # Base directory where websites are stored
-BASE_DIR = "/mnt/sites"
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Use libyaml when available; the pure-Python parser dominates compose regeneration at hundreds of sites
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Compose file generated for the detected websites
+COMPOSE_FILE = "utils/docker-compose.generated.yml"
+
+# Set SERVE_MODE=static to build every site and serve the output from one shared static server
+# instead of one dev server container per site
+SERVE_STATIC = os.environ.get("SERVE_MODE", "dev") == "static"
+
+# Service of the shared static serving tier
+STATIC_SERVICE = "static-server"
+STATIC_PORT = int(os.environ.get("STATIC_PORT", 8090))
+
+# Directory holding the app modules, mounted into the static server
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@traced("detect")
+def detect_website_stacks(base_dir=BASE_DIR, use_index=True):
+    """
+    Return the websites found under base_dir. By default the persistent site index is used,
+    which only re-lists directories whose mtime changed since the previous scan.
+    """
+    if use_index:
+        index = SiteIndex(base_dir)
+        websites = index.scan()
+        print(f"Site index: {len(websites)} sites ({index.last_scan['listed']} directories listed, {index.last_scan['reused']} reused)")
+        return [{"name": site["name"], "stack": site["stack"], "path": site["path"]} for site in websites]
 
-# Default ports for different stacks
-DEFAULT_PORTS = {
-    "hugo": 1313,
-    "next.js": 3000
-}
-
-def detect_website_stacks(base_dir=BASE_DIR):
     websites = []
     for dirpath, dirnames, filenames in os.walk(base_dir):
+        # Skip internal directories such as .templates, .cache and .logs
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
         if "hugo.toml" in filenames:
             websites.append({"name": os.path.basename(dirpath), "stack": "hugo", "path": dirpath})
         elif "next.config.js" in filenames:
             websites.append({"name": os.path.basename(dirpath), "stack": "next.js", "path": dirpath})
     return websites
 
-def generate_docker_compose(websites, output_file="utils/docker-compose.generated.yml"):
+def build_service(website, port):
+    """
+    Return the docker-compose service definition for a website.
+    """
+    stack = website["stack"]
+    name = website["name"]
+
+    # Define service configuration for this stack
+    service = {
+        "build": website["path"],
+        "ports": [f"{port}:{port}"],
+        "volumes": [f"./{stack}/{name}:/app"],
+        "container_name": f"{stack}_{name}_container",
+        "restart": "always"
+    }
+
+    if stack == "hugo":
+        service["command"] = ["hugo", "server", "--bind", "0.0.0.0", "--port", str(port)]
+    elif stack == "next.js":
+        service["command"] = ["npm", "start"]
+    return service
+
+def build_static_service(port=STATIC_PORT, base_dir=BASE_DIR):
+    """
+    Return the service definition of the shared static server, which serves every site's build
+    output with hostname routing (see static_server.py).
+    """
+    return {
+        "image": "python:latest",
+        "working_dir": "/app",
+        "command": ["python3", "-u", "/app/static_server.py", "--port", str(port)],
+        "ports": [f"{port}:{port}"],
+        "volumes": [f"{APP_DIR}:/app:ro", f"{os.path.join(os.path.dirname(APP_DIR), 'utils')}:/app/utils:ro",
+                    f"{base_dir}:/mnt/sites:ro"],
+        "environment": ["SITES_DIR=/mnt/sites", "GENERATOR_TRACE_FILE="],
+        "container_name": f"{STATIC_SERVICE}_container",
+        "restart": "always"
+    }
+
+def load_docker_compose(compose_file=COMPOSE_FILE):
+    """
+    Return the services of an existing compose file, or an empty mapping.
+    """
+    try:
+        with open(compose_file, "r") as file:
+            content = yaml.load(file, Loader=YAML_LOADER) or {}
+    except FileNotFoundError:
+        return {}
+    return content.get("services") or {}
+
+def get_fingerprint_file(compose_file):
+    return compose_file + ".fingerprints.json"
+
+def service_fingerprint(service):
+    return hashlib.sha256(json.dumps(service, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_fingerprints(compose_file):
+    """
+    Return {service name: fingerprint} of the services in an existing compose file. The copy
+    saved next to the file is used while the file's size and mtime match it; otherwise (e.g. the
+    file was edited by hand) the file itself is parsed.
+    """
+    try:
+        stat = os.stat(compose_file)
+    except FileNotFoundError:
+        return {}
+    try:
+        with open(get_fingerprint_file(compose_file), 'r') as file:
+            saved = json.load(file)
+        if saved["file"] == [stat.st_size, stat.st_mtime_ns]:
+            return saved["services"]
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        pass
+    return {name: service_fingerprint(service) for name, service in load_docker_compose(compose_file).items()}
+
+def save_fingerprints(compose_file, fingerprints):
+    stat = os.stat(compose_file)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(compose_file) or ".", suffix=".tmp")
+    with os.fdopen(fd, 'w') as file:
+        json.dump({"file": [stat.st_size, stat.st_mtime_ns], "services": fingerprints}, file)
+    os.replace(tmp_path, get_fingerprint_file(compose_file))
+
+@traced("compose.generate")
+def generate_docker_compose(websites, output_file=COMPOSE_FILE, ledger_file=None, static=False, unbuilt=()):
+    """
+    Update the docker-compose file for the websites. Ports come from a persistent ledger so each
+    service keeps its port across runs, and the file is only rewritten when a service changed.
+    Services are compared by fingerprint (see load_fingerprints), so a no-op call never parses the file.
+    With static=True the file holds the shared static server plus a dev service for each site
+    whose path is in `unbuilt` (its static build failed), so those sites stay online.
+    Returns the names of the added, changed, removed and unchanged services.
+    """
+    ledger = PortLedger(ledger_file or os.path.join(os.path.dirname(output_file), "port-ledger.json"))
+    ports = ledger.sync({f"{website['stack']}_{website['name']}": website["stack"] for website in websites})
+
     services = {}
-    used_ports = set()
-    
+    if static:
+        services[STATIC_SERVICE] = build_static_service()
     for website in websites:
-        stack = website["stack"]
-        name = website["name"]
-        path = website["path"]
-
-        # Find an available port, starting from the default
-        port = DEFAULT_PORTS.get(stack, 8000)
-        while port in used_ports:
-            port += 1  # Increment port if already used
-        used_ports.add(port)
-
-        # Define service configuration for this stack
-        service = {
-            "build": path,
-            "ports": [f"{port}:{port}"],
-            "volumes": [f"./{stack}/{name}:/app"],
-            "container_name": f"{stack}_{name}_container",
-            "restart": "always"
-        }
-
-        if stack == "hugo":
-            service["command"] = ["hugo", "server", "--bind", "0.0.0.0", "--port", str(port)]
-        elif stack == "next.js":
-            service["command"] = ["npm", "start"]
-
-        # Add the service to the docker-compose services
-        services[f"{stack}_{name}"] = service
+        if static and website["path"] not in unbuilt:
+            continue
+        service_name = f"{website['stack']}_{website['name']}"
+        services[service_name] = build_service(website, ports[service_name])
+
+    fingerprints = {name: service_fingerprint(service) for name, service in services.items()}
+    existing = load_fingerprints(output_file)
+    diff = {
+        "added": sorted(name for name in fingerprints if name not in existing),
+        "changed": sorted(name for name in fingerprints if name in existing and existing[name] != fingerprints[name]),
+        "removed": sorted(name for name in existing if name not in fingerprints),
+    }
+    diff["unchanged"] = sorted(name for name in fingerprints if name in existing and existing[name] == fingerprints[name])
+
+    if not (diff["added"] or diff["changed"] or diff["removed"]) and os.path.exists(output_file):
+        print(f"Docker Compose file {output_file} is up to date.")
+        return diff
 
     # Create docker-compose content
     docker_compose_content = {
@@ -58,38 +176,61 @@ def generate_docker_compose(websites, output_file="utils/docker-compose.generate
         "services": services
     }
 
-    # Write to the output file
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, "w") as file:
-        yaml.dump(docker_compose_content, file)
-
-    print(f"Docker Compose file generated at {output_file}")
-
-def serve_website(website):
-    stack = website["stack"]
-    path = website["path"]
-    
-    # Run docker-compose to bring up the service
-    if stack == "hugo":
-        subprocess.run(["docker-compose", "-f", "utils/docker-compose.generated.yml", "up", "-d"])
-    elif stack == "next.js":
-        subprocess.run(["docker-compose", "-f", "utils/docker-compose.generated.yml", "up", "-d"])
-
-def main():
+    # Write to the output file atomically so a concurrent docker-compose never reads a partial file
+    output_dir = os.path.dirname(output_file) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        yaml.dump(docker_compose_content, file, Dumper=YAML_DUMPER)
+    os.replace(tmp_path, output_file)
+    save_fingerprints(output_file, fingerprints)
+
+    print(f"Docker Compose file generated at {output_file} "
+          f"({len(diff['added'])} added, {len(diff['changed'])} changed, {len(diff['removed'])} removed)")
+    return diff
+
+def serve_website(website, compose_file=COMPOSE_FILE):
+    """
+    Bring up the container of a single website.
+    """
+    return deploy(compose_file, [f"{website['stack']}_{website['name']}"])
+
+def main(full=False, parallel=None, watch=False, static=SERVE_STATIC):
     websites = detect_website_stacks()
     
-    if not websites:
+    if not websites and not watch:
         print("No websites found. Exiting.")
         return
 
+    unbuilt = set()
+    if static:
+        unbuilt = {path for path, output_dir in build_sites(websites).items() if output_dir is None}
+
     # Generate docker-compose file dynamically
-    generate_docker_compose(websites)
-    
-    # Serve websites using the generated Docker Compose file
-    for website in websites:
-        print(f"Serving {website['stack']} website: {website['name']}")
-        serve_website(website)
+    diff = generate_docker_compose(websites, static=static, unbuilt=unbuilt)
 
-if __name__ == "__main__":
-    main()
+    # Reconcile once: new and modified services plus any that are not running
+    if full:
+        services = None
+    else:
+        running = running_services(COMPOSE_FILE)
+        services = diff["added"] + diff["changed"] + [service for service in diff["unchanged"] if service not in running]
+        remove_services(diff["removed"])
 
+    print(f"Serving {len(websites)} websites ({'all' if services is None else len(services)} services to deploy)")
+    deploy(COMPOSE_FILE, services, parallel=parallel)
+    print_summary()
+
+    if watch:
+        # Imported here because the watcher builds on this module's compose generation
+        from watcher import LiveRedeployer
+        LiveRedeployer(COMPOSE_FILE, parallel=parallel, static=static, unbuilt=unbuilt).run()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect websites and serve them with docker-compose.")
+    parser.add_argument("--full", action="store_true", help="Reconcile every service instead of only changed ones")
+    parser.add_argument("--parallel", type=int, default=None, help="Number of containers started at the same time")
+    parser.add_argument("--watch", action="store_true", help="Keep running and redeploy sites as they are added, edited or removed")
+    parser.add_argument("--static", action="store_true", default=SERVE_STATIC, help="Build every site and serve it from one shared static server")
+    args = parser.parse_args()
+    main(full=args.full, parallel=args.parallel, watch=args.watch, static=args.static)
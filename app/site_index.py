@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Persistent index of discovered sites, relative to the base directory (dot-directories are never scanned)
+INDEX_FILE = os.path.join(".cache", "site_index.json")
+
+# Marker file identifying each stack, checked in order
+STACK_MARKERS = [("hugo.toml", "hugo"), ("next.config.js", "next.js")]
+
+# Subtrees that never contain sites and can hold millions of files
+PRUNED_DIRS = {"node_modules", "themes", "public", "resources"}
+
+class SiteIndex:
+    def __init__(self, base_dir=BASE_DIR, index_file=None):
+        """
+        Persistent index of the sites under base_dir. For every visited directory it stores
+        the directory mtime, its child directories and the site detected in it (if any).
+        A later scan only lists directories whose mtime changed; unchanged ones cost one stat.
+        """
+        self.base_dir = base_dir
+        self.index_file = index_file or os.path.join(base_dir, INDEX_FILE)
+        self.dirs = {}
+        self.last_scan = {"listed": 0, "reused": 0}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file, 'r') as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("base_dir") == self.base_dir:
+            self.dirs = data.get("dirs", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_file), suffix=".tmp")
+        with os.fdopen(fd, 'w') as file:
+            json.dump({"base_dir": self.base_dir, "dirs": self.dirs}, file)
+        os.replace(tmp_path, self.index_file)
+
+    def scan(self):
+        """
+        Bring the index up to date with the filesystem and return the list of sites.
+        """
+        with self._lock:
+            dirs, listed, reused, changed = self._walk(self.base_dir, self.dirs)
+            changed |= dirs.keys() != self.dirs.keys()
+            self.dirs = dirs
+            self.last_scan = {"listed": listed, "reused": reused}
+            if changed:
+                self.save()
+            return self.sites()
+
+    def _walk(self, root, previous):
+        """
+        Visit the directories below root, reusing the entries in `previous` whose mtime is unchanged.
+        Returns (entries, listed, reused, changed).
+        """
+        dirs = {}
+        listed = reused = 0
+        changed = False
+        pending = [root]
+
+        while pending:
+            path = pending.pop()
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+
+            entry = previous.get(path)
+            if entry is not None and entry["mtime"] == mtime:
+                reused += 1
+                if entry["site"] is not None:
+                    changed |= self._refresh_marker(path, entry["site"])
+            else:
+                listed += 1
+                changed = True
+                entry = self._list_dir(path, mtime)
+
+            dirs[path] = entry
+            pending.extend(os.path.join(path, subdir) for subdir in reversed(entry["subdirs"]))
+        return dirs, listed, reused, changed
+
+    def locate(self, path):
+        """
+        Return the directory to refresh after `path` changed: the site that contains it (indexed,
+        or newly marked), otherwise the outermost directory along it that is not indexed yet.
+        Returns None for paths outside base_dir and for changes that cannot affect any site.
+        """
+        path = os.path.normpath(path)
+        if path != self.base_dir and not path.startswith(self.base_dir + os.sep):
+            return None
+
+        ancestors = [path]  # Deepest first
+        while ancestors[-1] != self.base_dir:
+            ancestors.append(os.path.dirname(ancestors[-1]))
+
+        for directory in ancestors:
+            entry = self.dirs.get(directory)
+            if entry is not None and entry["site"] is not None:
+                return directory
+        for directory in ancestors:
+            if any(os.path.exists(os.path.join(directory, marker)) for marker, _ in STACK_MARKERS):
+                return directory
+        for directory in reversed(ancestors):
+            if directory not in self.dirs:
+                if directory == path and os.path.isfile(path):
+                    return None  # A plain file outside any site
+                return directory
+        # An existing non-site directory only changed its children, which are reported themselves
+        return None if os.path.isdir(path) else path
+
+    def refresh(self, path):
+        """
+        Bring the index up to date for one directory and what is below it, leaving the rest of
+        the tree untouched. Returns {"added", "removed", "kept"} lists of the sites below path.
+        """
+        with self._lock:
+            path = os.path.normpath(path)
+            prefix = path + os.sep
+            previous = {directory: entry for directory, entry in self.dirs.items()
+                        if directory == path or directory.startswith(prefix)}
+            dirs, listed, reused, changed = self._walk(path, previous)
+            changed |= dirs.keys() != previous.keys()
+            for directory in previous:
+                del self.dirs[directory]
+            self.dirs.update(dirs)
+
+            # Keep the parent's child list in step so a later full scan still reuses it
+            parent = os.path.dirname(path)
+            if path != self.base_dir and parent in self.dirs:
+                try:
+                    mtime = os.stat(parent).st_mtime
+                except FileNotFoundError:
+                    mtime = None
+                if mtime is not None and mtime != self.dirs[parent]["mtime"]:
+                    self.dirs[parent] = self._list_dir(parent, mtime)
+                    changed = True
+
+            self.last_scan = {"listed": listed, "reused": reused}
+            if changed:
+                self.save()
+
+            before = {directory: entry["site"] for directory, entry in previous.items() if entry["site"] is not None}
+            after = {directory: entry["site"] for directory, entry in dirs.items() if entry["site"] is not None}
+            return {
+                "added": [self._site_record(directory, after[directory]) for directory in sorted(after.keys() - before.keys())],
+                "removed": [self._site_record(directory, before[directory]) for directory in sorted(before.keys() - after.keys())],
+                "kept": [self._site_record(directory, after[directory]) for directory in sorted(after.keys() & before.keys())],
+            }
+
+    def _list_dir(self, path, mtime):
+        try:
+            entries = list(os.scandir(path))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return {"mtime": mtime, "subdirs": [], "site": None}
+
+        filenames = {entry.name for entry in entries if entry.is_file()}
+        site = None
+        for marker, stack in STACK_MARKERS:
+            if marker in filenames:
+                marker_path = os.path.join(path, marker)
+                site = {"stack": stack, "marker": marker, "marker_mtime": os.stat(marker_path).st_mtime}
+                break
+
+        # Do not descend into sites or known-heavy subtrees
+        subdirs = []
+        if site is None:
+            subdirs = sorted(entry.name for entry in entries
+                             if entry.is_dir(follow_symlinks=False)
+                             and not entry.name.startswith(".") and entry.name not in PRUNED_DIRS)
+        return {"mtime": mtime, "subdirs": subdirs, "site": site}
+
+    @staticmethod
+    def _refresh_marker(path, site):
+        try:
+            marker_mtime = os.stat(os.path.join(path, site["marker"])).st_mtime
+        except FileNotFoundError:
+            return False
+        if marker_mtime == site["marker_mtime"]:
+            return False
+        site["marker_mtime"] = marker_mtime
+        return True
+
+    def sites(self):
+        """
+        Return the indexed sites (name, stack, path and marker file mtime).
+        """
+        return [self._site_record(path, entry["site"]) for path, entry in sorted(self.dirs.items())
+                if entry["site"] is not None]
+
+    @staticmethod
+    def _site_record(path, site):
+        return {"name": os.path.basename(path), "stack": site["stack"], "path": path, "marker_mtime": site["marker_mtime"]}
+
+    def query(self, stack=None, name=None):
+        """
+        Return the indexed sites filtered by stack and/or name, without touching the filesystem.
+        """
+        return [site for site in self.sites()
+                if (stack is None or site["stack"] == stack) and (name is None or site["name"] == name)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the persistent site index.")
+    parser.add_argument("--stack", help="Only list sites of this stack")
+    parser.add_argument("--name", help="Only list sites with this name")
+    parser.add_argument("--no-scan", action="store_true", help="Query the stored index without rescanning")
+    args = parser.parse_args()
+
+    index = SiteIndex()
+    if not args.no_scan:
+        index.scan()
+    print(json.dumps(index.query(stack=args.stack, name=args.name), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from npm_store import npm_env
+from utils.tracing import span, traced_run
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it only gzip variants are written
+    brotli = None
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Input hashes and file fingerprints of the last successful build of each site
+BUILD_RECORD_DIR = os.path.join(BASE_DIR, ".cache", "builds")
+
+# Hugo caches shared by every build: modules/downloads (cacheDir) and processed images/assets
+# (resourceDir, normally each site's resources/_gen). Entries are content-addressed, so sites can share them.
+HUGO_CACHE_DIR = os.path.join(BASE_DIR, ".cache", "hugo", "cache")
+HUGO_RESOURCE_DIR = os.path.join(BASE_DIR, ".cache", "hugo", "resources")
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))  # Honours container CPU limits set through cpusets
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Builds run at the same time; each build is multi-threaded itself, so default to half the CPUs
+BUILD_MAX_WORKERS = int(os.environ.get("BUILD_MAX_WORKERS", max(1, available_cpus() // 2)))
+
+# Static output of each stack's production build, relative to the site directory.
+# Next.js only exports to out/ with `output: 'export'`; build_site patches next.config.js to set it.
+OUTPUT_DIRS = {"hugo": "public", "next.js": "out"}
+
+# Files worth precompressing; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".mjs", ".json", ".xml", ".svg", ".txt", ".map", ".webmanifest", ".ico"}
+
+# Smaller files gain nothing from compression
+MIN_COMPRESS_BYTES = 512
+
+ENCODINGS = {
+    ".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    ".br": (lambda data: brotli.compress(data, quality=11)) if brotli else None,
+}
+
+def build_command(stack):
+    """
+    Return the command that builds a site of the stack into its static output directory.
+    """
+    if stack == "hugo":
+        return ["hugo", "--minify", "--cleanDestinationDir"]
+    elif stack == "next.js":
+        return ["npx", "next", "build"]
+    else:
+        raise ValueError(f"Unsupported stack: {stack}")
+
+def get_output_dir(site):
+    return os.path.join(site["path"], OUTPUT_DIRS[site["stack"]])
+
+def build_env(stack, threads=None):
+    """
+    Return the environment of a build: shared Hugo caches (with GOMAXPROCS capped so parallel
+    builds do not oversubscribe the CPUs) or the shared npm cache and NEXT_STATIC_EXPORT, which
+    the patched next.config.js reads to switch to a static export.
+    """
+    if stack == "hugo":
+        env = dict(os.environ, HUGO_CACHEDIR=HUGO_CACHE_DIR, HUGO_RESOURCEDIR=HUGO_RESOURCE_DIR)
+        if threads:
+            env["GOMAXPROCS"] = str(threads)
+        return env
+    return dict(npm_env(), NEXT_STATIC_EXPORT="1")
+
+def build_site(site, threads=None):
+    """
+    Build a site to static files and precompress them. Returns the output directory, or None
+    when the build failed or produced no index.html; such sites keep their dev server.
+    """
+    output_dir = get_output_dir(site)
+    if site["stack"] == "next.js":
+        # Imported here so the static server, which only reads build output, does not need toml
+        from config_editor import ConfigParseError, set_nextjs_static_export
+        try:
+            set_nextjs_static_export(os.path.join(site["path"], "next.config.js"))
+        except (ConfigParseError, OSError) as e:
+            print(f"Cannot enable the static export of next.js site {site['name']}: {e}")
+            return None
+    result = traced_run("static.build", build_command(site["stack"]), cwd=site["path"],
+                        env=build_env(site["stack"], threads), capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"Build of {site['stack']} site {site['name']} failed with exit code {result.returncode}: {result.stderr.strip()[-500:]}")
+        return None
+    if not os.path.exists(os.path.join(output_dir, "index.html")):
+        print(f"Build of {site['stack']} site {site['name']} produced no {OUTPUT_DIRS[site['stack']]}/index.html; skipping it")
+        return None
+    precompress(output_dir)
+    return output_dir
+
+def source_entries(site):
+    """
+    Yield (relative path, stat) of every file a build of the site reads: sources, config and
+    theme. Build output, dependencies (covered by package.json/package-lock.json), generated
+    resources and dot-entries (.git, .next) are skipped.
+    """
+    skipped = {OUTPUT_DIRS[site["stack"]], "node_modules", os.path.join("resources", "_gen")}
+    pending = [""]
+    while pending:
+        relative_dir = pending.pop()
+        try:
+            entries = list(os.scandir(os.path.join(site["path"], relative_dir)))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for entry in entries:
+            relative = os.path.join(relative_dir, entry.name)
+            if entry.name.startswith(".") or relative in skipped or entry.name == "node_modules":
+                continue
+            if entry.is_dir():
+                pending.append(relative)
+            elif entry.is_file():
+                yield relative, entry.stat()
+
+class BuildFarm:
+    def __init__(self, max_workers=BUILD_MAX_WORKERS, record_dir=BUILD_RECORD_DIR, force=False):
+        """
+        Parallel static builds that skip every site whose inputs are unchanged since its last
+        successful build. The input hash covers the content of each source, config and theme file;
+        files are only re-read when their size or mtime changed since they were last hashed.
+        """
+        self.max_workers = max(1, max_workers)
+        self.record_dir = record_dir
+        self.force = force
+
+    def get_record_file(self, site):
+        return os.path.join(self.record_dir, f"{site['stack']}_{site['name']}.json")
+
+    def load_record(self, site):
+        try:
+            with open(self.get_record_file(site), 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_record(self, site, record):
+        os.makedirs(self.record_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.record_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w') as file:
+            json.dump(record, file)
+        os.replace(tmp_path, self.get_record_file(site))
+
+    def input_hash(self, site, record):
+        """
+        Return (hash, fingerprints) of the site's build inputs. fingerprints maps each relative
+        path to [size, mtime_ns, sha256], reusing the digests recorded for unchanged files.
+        """
+        known = record.get("files", {})
+        fingerprints = {}
+        for relative, stat in source_entries(site):
+            previous = known.get(relative)
+            if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+                digest = previous[2]
+            else:
+                digest = hashlib.sha256()
+                with open(os.path.join(site["path"], relative), 'rb') as file:
+                    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                digest = digest.hexdigest()
+            fingerprints[relative] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        combined = hashlib.sha256(json.dumps(build_command(site["stack"])).encode("utf-8"))
+        for relative in sorted(fingerprints):
+            combined.update(f"{relative}\0{fingerprints[relative][2]}\n".encode("utf-8"))
+        return combined.hexdigest(), fingerprints
+
+    def build(self, site, threads=None):
+        """
+        Build one site unless its inputs are unchanged and its output is still there.
+        Returns {"status": "built" | "skipped" | "failed", "duration", "output_dir"}.
+        """
+        with span("static.site", **{"build.site": f"{site['stack']}_{site['name']}"}) as current:
+            record = self.load_record(site)
+            input_hash, fingerprints = self.input_hash(site, record)
+            output_dir = get_output_dir(site)
+            if (not self.force and record.get("input_hash") == input_hash
+                    and os.path.exists(os.path.join(output_dir, "index.html"))):
+                current.set(**{"build.status": "skipped"})
+                return {"status": "skipped", "duration": 0.0, "output_dir": output_dir}
+
+            started = time.time()
+            built = build_site(site, threads)
+            duration = round(time.time() - started, 3)
+            current.set(**{"build.status": "built" if built else "failed"})
+            if not built:
+                return {"status": "failed", "duration": duration, "output_dir": None}
+
+            # Hash again after the build: a build that touched its own inputs must not look stale next time
+            input_hash, fingerprints = self.input_hash(site, {"files": fingerprints})
+            self.save_record(site, {"input_hash": input_hash, "duration": duration, "built_at": time.time(),
+                                    "files": fingerprints})
+            return {"status": "built", "duration": duration, "output_dir": built}
+
+    def build_all(self, sites):
+        """
+        Build the sites in parallel, longest previous build first so a slow site does not start
+        last. Returns {site path: result} as returned by build().
+        """
+        durations = {site["path"]: self.load_record(site).get("duration", 0.0) for site in sites}
+        ordered = sorted(sites, key=lambda site: durations[site["path"]], reverse=True)
+        workers = min(self.max_workers, len(ordered)) or 1
+        threads = max(1, available_cpus() // workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {site["path"]: executor.submit(contextvars.copy_context().run, self.build, site, threads)
+                       for site in ordered}
+            results = {path: future.result() for path, future in futures.items()}
+
+        counts = {status: sum(1 for result in results.values() if result["status"] == status)
+                  for status in ("built", "skipped", "failed")}
+        print(f"Static builds: {counts['built']} built, {counts['skipped']} unchanged, {counts['failed']} failed "
+              f"({workers} in parallel)")
+        return results
+
+def build_sites(sites, force=False):
+    """
+    Build every site for the static tier and return {site path: output directory or None}.
+    """
+    results = BuildFarm(force=force).build_all(sites)
+    return {path: result["output_dir"] for path, result in results.items()}
+
+def precompress(output_dir):
+    """
+    Write .gz (and, with the brotli module, .br) files next to every compressible file whose
+    compressed copies are missing or older than the file. Stale copies of removed files are deleted.
+    Returns the number of files written.
+    """
+    written = 0
+    with span("static.precompress") as current:
+        for dirpath, _, filenames in os.walk(output_dir):
+            names = set(filenames)
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                base, suffix = os.path.splitext(filename)
+                if suffix in ENCODINGS and os.path.splitext(base)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                    if base not in names:
+                        os.remove(path)  # Its original is gone
+                    continue
+                if suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+                    continue
+                stat = os.stat(path)
+                if stat.st_size < MIN_COMPRESS_BYTES:
+                    continue
+                data = None
+                for extension, compress in ENCODINGS.items():
+                    if compress is None:
+                        continue
+                    target = path + extension
+                    try:
+                        if os.stat(target).st_mtime_ns == stat.st_mtime_ns:
+                            continue
+                    except FileNotFoundError:
+                        pass
+                    if data is None:
+                        with open(path, 'rb') as file:
+                            data = file.read()
+                    fd, tmp_path = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+                    with os.fdopen(fd, 'wb') as file:
+                        file.write(compress(data))
+                    # Same mtime as the original marks the copy as current
+                    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                    os.replace(tmp_path, target)
+                    written += 1
+        current.set(**{"static.files_written": written})
+    return written
@@ -0,0 +1,239 @@
+import argparse
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+from site_index import SiteIndex
+from static_build import COMPRESSIBLE_EXTENSIONS, get_output_dir
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Address the static tier listens on
+STATIC_HOST = os.environ.get("STATIC_HOST", "0.0.0.0")
+STATIC_PORT = int(os.environ.get("STATIC_PORT", 8090))
+
+# Sites are served as <name>.<domain>, and per stack as <stack>.<name>.<domain> (e.g. nextjs.acme.localhost)
+STATIC_DOMAIN = os.environ.get("STATIC_DOMAIN", "localhost")
+
+# In-memory cache of small, frequently requested files; larger files are sent with sendfile
+HOT_CACHE_MAX_BYTES = int(os.environ.get("STATIC_HOT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+HOT_FILE_MAX_BYTES = int(os.environ.get("STATIC_HOT_FILE_MAX_BYTES", 256 * 1024))
+
+# Seconds between checks of the site index for added or removed sites
+ROUTE_RELOAD_INTERVAL = 1.0
+
+# Precompressed variants, in order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+class RouteTable:
+    def __init__(self, base_dir=BASE_DIR, domain=STATIC_DOMAIN):
+        """
+        Hostname -> output directory of every indexed site. Built from the persistent site index
+        and rebuilt whenever the index file changes, so new sites are routed without a restart.
+        """
+        self.index = SiteIndex(base_dir)
+        self.domain = domain.lower()
+        self.routes = {}
+        self.index_mtime = None
+        self.next_check = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.index.index_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.index_mtime and self.routes:
+            return
+        self.index.load()
+        routes = {}
+        # Sites are sorted by path, so a bare <name>.<domain> goes to the hugo build when both exist
+        for site in self.index.sites():
+            output_dir = get_output_dir(site)
+            routes[f"{site['stack'].replace('.', '')}.{site['name']}.{self.domain}".lower()] = output_dir
+            routes.setdefault(f"{site['name']}.{self.domain}".lower(), output_dir)
+        self.routes = routes
+        self.index_mtime = mtime
+
+    def resolve(self, host):
+        now = time.monotonic()
+        if now >= self.next_check:
+            with self._lock:
+                if now >= self.next_check:
+                    self.reload()
+                    self.next_check = now + ROUTE_RELOAD_INTERVAL
+        return self.routes.get(host.split(":")[0].rstrip(".").lower())
+
+class HotFileCache:
+    def __init__(self, max_bytes=HOT_CACHE_MAX_BYTES):
+        """
+        LRU cache of file contents keyed by path and validated by ETag.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()  # path -> (etag, data)
+        self._lock = threading.Lock()
+
+    def get(self, path, etag):
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != etag:
+                return None
+            self.entries.move_to_end(path)
+            return entry[1]
+
+    def put(self, path, etag, data):
+        with self._lock:
+            previous = self.entries.pop(path, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self.entries[path] = (etag, data)
+            self.size += len(data)
+            while self.size > self.max_bytes and self.entries:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+def find_file(root, url_path):
+    """
+    Map a URL path to a file under root: the file itself, <dir>/index.html or <path>.html.
+    The path is normalised first, so it can never leave root.
+    """
+    relative = os.path.normpath("/" + url_path).lstrip("/")
+    path = os.path.join(root, relative)
+    for candidate in (path, os.path.join(path, "index.html"), path + ".html"):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+class StaticHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    server_version = "website-generator-static"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.serve(head=False)
+
+    def do_HEAD(self):
+        self.serve(head=True)
+
+    def send_text(self, status, text, head=False):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def serve(self, head):
+        root = self.server.routes.resolve(self.headers.get("Host", ""))
+        if root is None:
+            self.send_text(404, "Unknown site\n", head)
+            return
+        url_path = unquote(urlparse(self.path).path)
+        if "\0" in url_path:
+            self.send_text(400, "Bad request\n", head)
+            return
+
+        status = 200
+        path = find_file(root, url_path)
+        if path is None:
+            status = 404
+            path = os.path.join(root, "404.html")
+            if not os.path.isfile(path):
+                self.send_text(404, "Not found\n", head)
+                return
+
+        # Use a precompressed copy when the client accepts it and it is as recent as the file
+        stat = os.stat(path)
+        served_path, encoding = path, None
+        compressible = os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+        if compressible:
+            accepted = accepted_encodings(self.headers.get("Accept-Encoding", ""))
+            for name, extension in ENCODINGS:
+                if name in accepted:
+                    try:
+                        variant = os.stat(path + extension)
+                    except FileNotFoundError:
+                        continue
+                    if variant.st_mtime_ns == stat.st_mtime_ns:
+                        served_path, encoding, stat = path + extension, name, variant
+                        break
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+        if status == 200 and etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            if compressible:
+                self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        self.send_header("Cache-Control", "no-cache")  # Revalidate with the ETag; builds reuse file names
+        if compressible:
+            self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        if head:
+            return
+
+        if stat.st_size <= HOT_FILE_MAX_BYTES:
+            data = self.server.cache.get(served_path, etag)
+            if data is None:
+                with open(served_path, 'rb') as file:
+                    data = file.read()
+                self.server.cache.put(served_path, etag, data)
+            self.wfile.write(data)
+        else:
+            # Zero-copy from the page cache to the socket
+            with open(served_path, 'rb') as file:
+                self.connection.sendfile(file, count=stat.st_size)
+
+def make_server(host=STATIC_HOST, port=STATIC_PORT, base_dir=BASE_DIR, domain=STATIC_DOMAIN):
+    server = ThreadingHTTPServer((host, port), StaticHandler)
+    server.daemon_threads = True
+    server.routes = RouteTable(base_dir, domain)
+    server.cache = HotFileCache()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the static builds of every site from one process.")
+    parser.add_argument("--host", default=STATIC_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=STATIC_PORT, help="Port to listen on")
+    parser.add_argument("--domain", default=STATIC_DOMAIN, help="Domain the site hostnames end with")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, domain=args.domain)
+    print(f"Serving {len(server.routes.routes)} hostnames on http://{args.host}:{args.port} (*.{args.domain})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
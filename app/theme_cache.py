@@ -0,0 +1,106 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+from utils.tracing import traced_run
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Shared bare mirrors of theme repositories
+MIRROR_DIR = os.path.join(BASE_DIR, ".cache", "themes")
+
+# Seconds after which a mirror is refreshed in the background
+FETCH_INTERVAL = int(os.environ.get("THEME_MIRROR_FETCH_INTERVAL", 3600))
+
+_mirror_locks = {}
+_locks_guard = threading.Lock()
+
+# Background `git remote update` of each mirror: mirror path -> Popen
+_refreshes = {}
+
+def _lock_for(path):
+    with _locks_guard:
+        return _mirror_locks.setdefault(path, threading.Lock())
+
+def reap_refreshes():
+    """
+    Collect the exit status of finished background refreshes so they do not linger as zombies.
+    """
+    with _locks_guard:
+        for mirror_path, process in list(_refreshes.items()):
+            if process.poll() is not None:
+                del _refreshes[mirror_path]
+
+class ThemeMirrorCache:
+    def __init__(self, mirror_dir=MIRROR_DIR, fetch_interval=FETCH_INTERVAL):
+        """
+        Cache of bare `git clone --mirror` copies of theme repositories. Sites get a shallow
+        clone of the local mirror, so only the first install of a theme touches the network.
+        """
+        self.mirror_dir = mirror_dir
+        self.fetch_interval = fetch_interval
+
+    def get_mirror_path(self, repo_url):
+        url = repo_url.rstrip("/").removesuffix(".git")
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.mirror_dir, f"{os.path.basename(url)}-{digest}.git")
+
+    def ensure_mirror(self, repo_url):
+        """
+        Return the local mirror of a repository, cloning it on first use and scheduling a
+        background fetch when it is older than the fetch interval.
+        """
+        mirror_path = self.get_mirror_path(repo_url)
+        reap_refreshes()
+        with _lock_for(mirror_path):
+            if not os.path.isdir(mirror_path):
+                os.makedirs(self.mirror_dir, exist_ok=True)
+                tmp_path = f"{mirror_path}.tmp"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                print(f"Mirroring {repo_url} into {mirror_path}...")
+                traced_run("git.mirror", ["git", "clone", "--mirror", "--quiet", repo_url, tmp_path], check=True)
+                os.rename(tmp_path, mirror_path)
+                self._touch_fetch_stamp(mirror_path)
+            elif self.is_stale(mirror_path):
+                self.fetch_in_background(mirror_path)
+        return mirror_path
+
+    def is_stale(self, mirror_path):
+        try:
+            last_fetch = os.path.getmtime(f"{mirror_path}.fetched")
+        except FileNotFoundError:
+            return True
+        return time.time() - last_fetch > self.fetch_interval
+
+    def fetch_in_background(self, mirror_path):
+        """
+        Start a background `git remote update` of the mirror unless one is still running;
+        the install continues from the current copy. Returns False when a refresh was already running.
+        """
+        with _locks_guard:
+            running = _refreshes.get(mirror_path)
+            if running is not None and running.poll() is None:
+                return False
+            self._touch_fetch_stamp(mirror_path)
+            _refreshes[mirror_path] = subprocess.Popen(["git", "--git-dir", mirror_path, "remote", "update", "--prune"],
+                                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                                       start_new_session=True)
+        return True
+
+    @staticmethod
+    def _touch_fetch_stamp(mirror_path):
+        with open(f"{mirror_path}.fetched", "w"):
+            pass
+
+    def install(self, repo_url, destination):
+        """
+        Check out a repository into destination as a shallow clone of its local mirror.
+        The clone's origin points back at the real repository URL.
+        """
+        mirror_path = self.ensure_mirror(repo_url)
+        traced_run("git.clone", ["git", "clone", "--quiet", "--depth", "1", f"file://{mirror_path}", destination], check=True)
+        subprocess.run(["git", "-C", destination, "remote", "set-url", "origin", repo_url], check=True)
+        return destination
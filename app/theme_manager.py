@@ -1,17 +1,28 @@
 import os
+import shutil
 import subprocess
-import ollama
 import re
-import requests
-from bs4 import BeautifulSoup
+import toml
+from config_editor import ConfigParseError, atomic_write, get_hugo_theme, get_nextjs_theme, set_hugo_theme, set_nextjs_theme
+from npm_store import NpmStore
+from theme_cache import ThemeMirrorCache
+from theme_validator import get_default_validator
+from utils.ollama_client import chat_with_ollama
+from utils.tracing import traced, traced_run
 
 # Base directory where websites are stored
-BASE_DIR = "/mnt/sites"
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
 
 class ThemeManager:
-    def __init__(self, stack, website_name):
+    def __init__(self, stack, website_name, interactive=True, ai_fallback=None):
         self.stack = stack
         self.website_name = website_name
+        self.interactive = interactive  # Never prompt on stdin when False (batch mode)
+        # Only ask the AI to rewrite configs that cannot be parsed when explicitly enabled
+        if ai_fallback is None:
+            ai_fallback = os.environ.get("THEME_AI_FALLBACK", "").lower() in ("1", "true", "yes")
+        self.ai_fallback = ai_fallback
+        self.validator = get_default_validator()  # Pooled, cached URL validation shared by all instances
         self.config_file = self.get_config_file()
         self.known_repos = {
             "ananke": "https://github.com/theNewDynamic/gohugo-theme-ananke"
@@ -28,28 +39,35 @@ class ThemeManager:
         else:
             raise ValueError(f"Unsupported stack: {self.stack}")
 
+    def get_package_file(self):
+        """
+        Return the package.json path of a Next.js website, where its theme is recorded.
+        """
+        return f"{BASE_DIR}/{self.stack}/{self.website_name}/package.json"
+
     def get_current_theme(self):
         """
         Display the current theme by reading the config file.
         """
         try:
-            with open(self.config_file, 'r') as config:
-                content = config.read()
-                if self.stack == "hugo":
-                    theme_line = next((line for line in content.splitlines() if "theme" in line), None)
-                    if theme_line:
-                        current_theme = theme_line.split('=')[-1].strip().strip('"')
-                        print(f"Current theme: {current_theme}")
-                        return current_theme
-                    else:
-                        print("No theme found in config.")
-                        return None
-                elif self.stack == "next.js":
-                    print("Next.js doesn't use a direct theme config.")
-                    return None
+            if self.stack == "hugo":
+                current_theme = get_hugo_theme(self.config_file)
+            elif self.stack == "next.js":
+                current_theme = get_nextjs_theme(self.get_package_file())
+            else:
+                raise ValueError(f"Unsupported stack: {self.stack}")
         except FileNotFoundError:
             print(f"Config file not found at {self.config_file}")
             return None
+        except ConfigParseError as e:
+            print(f"Error reading theme: {e}")
+            return None
+
+        if current_theme:
+            print(f"Current theme: {current_theme}")
+        else:
+            print("No theme found in config.")
+        return current_theme
 
     def initialize_theme(self, new_theme):
         """
@@ -86,6 +104,7 @@ class ThemeManager:
             print(f"No known fallback repository for theme '{new_theme}'.")
             self.prompt_for_new_theme()
 
+    @traced("theme.sources")
     def get_theme_sources_with_validation(self, theme_name):
         """
         Use AI to find the best sources (URLs or repositories) to download the theme and validate them.
@@ -93,27 +112,15 @@ class ThemeManager:
         # Ask AI for possible theme sources
         prompt = f"Find direct repository URLs for the theme '{theme_name}' for {self.stack}."
         try:
-            response = ollama.chat(model="llama3.1", messages=[{"role": "user", "content": prompt}])
+            response = chat_with_ollama([{"role": "user", "content": prompt}])
             response_text = response['message']['content']
 
             # Extract URLs using regex and filter out search result pages
             urls = [url for url in re.findall(r'https?://[^\s]+', response_text) if '?' not in url and url.startswith('https')]
 
-            valid_urls = []
-            for url in urls:
-                # Validate GitHub or GitLab repositories
-                if 'github.com' in url:
-                    if self.validate_github_repo(url):
-                        valid_urls.append(url)
-                        break  # Stop after the first valid URL is found
-                elif 'gitlab.com' in url:
-                    if self.validate_gitlab_repo(url):
-                        valid_urls.append(url)
-                        break  # Stop after the first valid URL is found
-                elif 'themes.gohugo.io' in url or 'hugohub.com' in url:
-                    if self.scrape_and_validate(url):
-                        valid_urls.append(url)
-                        break  # Stop after the first valid URL is found
+            # Check all suggestions concurrently and keep the first valid one
+            valid_url = self.validator.first_valid(urls)
+            valid_urls = [valid_url] if valid_url else []
 
             if valid_urls:
                 print(f"Valid URLs found: {valid_urls}")
@@ -129,64 +136,21 @@ class ThemeManager:
         """
         Use GitHub API to validate if the URL is a valid repository.
         """
-        try:
-            # Convert URL to API-friendly format for GitHub API
-            api_url = repo_url.replace("https://github.com/", "https://api.github.com/repos/")
-            response = requests.get(api_url)
-
-            if response.status_code == 200:
-                print(f"Valid GitHub repository: {repo_url}")
-                return True
-            else:
-                print(f"Invalid repository or not found: {repo_url}")
-                return False
-        except Exception as e:
-            print(f"Error validating GitHub repository: {e}")
-            return False
+        return self.validator.validate(repo_url)
 
     def validate_gitlab_repo(self, repo_url):
         """
         Use GitLab API to validate if the URL is a valid repository.
         """
-        try:
-            api_url = repo_url.replace("https://gitlab.com/", "https://gitlab.com/api/v4/projects/")
-            response = requests.get(api_url)
-
-            if response.status_code == 200:
-                print(f"Valid GitLab repository: {repo_url}")
-                return True
-            else:
-                print(f"Invalid GitLab repository: {repo_url}")
-                return False
-        except Exception as e:
-            print(f"Error validating GitLab repository: {e}")
-            return False
+        return self.validator.validate(repo_url)
 
     def scrape_and_validate(self, url):
         """
         Scrape theme-related URLs (e.g., Hugo theme directories) to check if the theme exists.
         """
-        try:
-            print(f"Scraping {url} for theme metadata...")
-            response = requests.get(url)
-            if response.status_code != 200:
-                print(f"Error accessing {url}: {response.status_code}")
-                return False
-
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Basic validation: Check if a link to a GitHub repository exists in the theme page
-            repo_link = soup.find('a', href=re.compile(r'https://github.com/'))
-            if repo_link:
-                print(f"Found valid repository link: {repo_link['href']}")
-                return True
-            else:
-                print(f"No valid theme repository found on {url}.")
-                return False
-        except Exception as e:
-            print(f"Error scraping {url}: {e}")
-            return False
+        return self.validator.validate(url)
 
+    @traced("theme.install")
     def install_hugo_theme(self, theme, theme_url):
         """
         Install the theme for Hugo from the valid theme URL.
@@ -195,7 +159,13 @@ class ThemeManager:
         if not os.path.exists(theme_dir):
             print(f"Installing Hugo theme '{theme}' from {theme_url}...")
             try:
-                subprocess.run(["git", "clone", theme_url, theme_dir], check=True)
+                try:
+                    # Shallow clone from the shared local mirror of the theme repository
+                    ThemeMirrorCache().install(theme_url, theme_dir)
+                except (subprocess.CalledProcessError, OSError) as e:
+                    print(f"Theme mirror unavailable ({e}); cloning {theme_url} directly.")
+                    shutil.rmtree(theme_dir, ignore_errors=True)
+                    traced_run("git.clone", ["git", "clone", "--depth", "1", theme_url, theme_dir], check=True)
                 print(f"Theme '{theme}' installed successfully.")
                 return True  # Stop further URL checks after successful installation
             except subprocess.CalledProcessError as e:
@@ -205,54 +175,76 @@ class ThemeManager:
             print(f"Theme '{theme}' is already installed.")
             return True  # Stop further URL checks if already installed
 
+    @traced("theme.install")
     def install_nextjs_theme(self, theme, theme_url):
         """
         Install the theme for Next.js using npm from a valid theme URL.
+        Installs go through the shared npm store, so a theme already installed in another
+        site with the same dependencies is replayed offline from its stored lockfile.
         """
         print(f"Installing Next.js theme '{theme}' from {theme_url}...")
         try:
-            subprocess.run(["npm", "install", theme], cwd=f"{BASE_DIR}/{self.stack}/{self.website_name}", check=True)
-            print(f"Theme '{theme}' installed successfully for Next.js.")
+            mode = NpmStore().install(f"{BASE_DIR}/{self.stack}/{self.website_name}", [theme])
+            print(f"Theme '{theme}' installed successfully for Next.js ({mode}).")
             return True  # Stop further URL checks after successful installation
         except subprocess.CalledProcessError as e:
             print(f"Error installing theme '{theme}': {e}")
             return False
 
+    @traced("theme.change")
     def change_theme(self, new_theme):
         """
-        Change the theme in the config file after ensuring it's valid.
+        Change the theme in the config file by parsing, patching and atomically rewriting it.
+        The AI rewrite is only used for Hugo configs that cannot be parsed, and only if ai_fallback is enabled.
         """
         try:
-            with open(self.config_file, 'r') as file:
-                config_content = file.read()
-
             if self.stack == "hugo":
-                new_content = self.replace_theme_in_hugo_config(config_content, new_theme)
+                try:
+                    set_hugo_theme(self.config_file, new_theme)
+                except ConfigParseError as e:
+                    if not self.ai_fallback:
+                        print(f"Error changing theme in {self.stack} for {self.website_name}: {e}")
+                        return False
+                    print(f"{e}. Falling back to AI theme replacement.")
+                    with open(self.config_file, 'r') as file:
+                        config_content = file.read()
+                    updated_config = self.replace_theme_in_hugo_config(config_content, new_theme)
+                    try:
+                        updated_theme = toml.loads(updated_config).get("theme")
+                    except toml.TomlDecodeError as e:
+                        print(f"The AI-rewritten config is not valid TOML ({e}); keeping {self.config_file} unchanged.")
+                        return False
+                    if updated_theme != new_theme:
+                        print(f"The AI-rewritten config sets theme {updated_theme!r} instead of {new_theme!r}; "
+                              f"keeping {self.config_file} unchanged.")
+                        return False
+                    atomic_write(self.config_file, updated_config)
             elif self.stack == "next.js":
-                print(f"Next.js doesn't use a direct theme config change.")
-                return
+                set_nextjs_theme(self.get_package_file(), new_theme)
             else:
                 raise ValueError(f"Unsupported stack: {self.stack}")
 
-            # Save the new content back to the config file
-            with open(self.config_file, 'w') as file:
-                file.write(new_content)
             print(f"Theme changed to {new_theme} in {self.stack} for {self.website_name}.")
+            return True
         except FileNotFoundError:
             print(f"Config file not found at {self.config_file}")
         except Exception as e:
             print(f"Error changing theme in {self.stack} for {self.website_name}: {e}")
-        print(f"Theme '{new_theme}' could not be found.")
+        return False
 
     def replace_theme_in_hugo_config(self, config_content, new_theme):
         """
         Use AI (Ollama) to replace the theme in the Hugo config file.
         """
-        prompt = f"Replace the current theme in the following Hugo config content with '{new_theme}': {config_content}"
+        prompt = f"Replace the current theme in the following Hugo config content with '{new_theme}'. " \
+                 f"Reply with the config file only: {config_content}"
 
         try:
-            response = ollama.chat(model="llama3.1", messages=[{"role": "user", "content": prompt}])
-            return response['message']['content']
+            response = chat_with_ollama([{"role": "user", "content": prompt}])
+            updated_config = response['message']['content']
+            # Keep only the contents of a fenced code block if the model added prose around it
+            fenced = re.search(r"```[a-zA-Z]*\n(.*?)```", updated_config, re.DOTALL)
+            return fenced.group(1) if fenced else updated_config
         except Exception as e:
             print(f"Error using Ollama for theme replacement: {e}")
             return config_content  # Return original config if AI fails
@@ -261,6 +253,9 @@ class ThemeManager:
         """
         Prompt the user for a new theme if the previous one is invalid or unknown.
         """
+        if not self.interactive:
+            print("Skipping theme change (non-interactive mode).")
+            return
         new_theme = input("Please enter a new theme or type 'skip' to move on: ").strip()
         if new_theme.lower() == 'skip':
             print("Skipping theme change.")
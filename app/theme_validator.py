@@ -0,0 +1,178 @@
+import contextvars
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from utils.tracing import span
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Persistent cache of validation results
+CACHE_FILE = os.path.join(BASE_DIR, ".cache", "theme_validation.json")
+
+# API endpoints, overridable to point at a local stub server
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+GITLAB_API_URL = os.environ.get("GITLAB_API_URL", "https://gitlab.com/api/v4")
+
+# How long results are trusted before being revalidated (with If-None-Match when an ETag is known)
+POSITIVE_TTL = int(os.environ.get("THEME_VALIDATION_TTL", 7 * 24 * 3600))
+NEGATIVE_TTL = int(os.environ.get("THEME_VALIDATION_NEGATIVE_TTL", 24 * 3600))
+
+# Characters the LLM tends to leave around URLs in prose or Markdown
+URL_TRAILING_CHARS = ").,;:'\"`>]*"
+
+class ThemeValidator:
+    def __init__(self, cache_file=CACHE_FILE, github_api_url=GITHUB_API_URL, gitlab_api_url=GITLAB_API_URL,
+                 timeout=10, max_workers=8):
+        """
+        Validate theme source URLs over one pooled keep-alive HTTP session, caching positive and
+        negative results on disk together with the ETag of each response.
+        """
+        self.cache_file = cache_file
+        self.github_api_url = github_api_url.rstrip("/")
+        self.gitlab_api_url = gitlab_api_url.rstrip("/")
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if os.environ.get("GITHUB_TOKEN"):
+            self.github_headers = {"Authorization": f"Bearer {os.environ['GITHUB_TOKEN']}"}
+        else:
+            self.github_headers = {}
+        self.cache = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Keeps concurrent saves from replacing a newer file with an older snapshot
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file, 'r') as file:
+                self.cache = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.cache = {}
+
+    def save_cache(self):
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self.cache)
+            directory = os.path.dirname(self.cache_file)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, 'w') as file:
+                file.write(data)
+            os.replace(tmp_path, self.cache_file)
+
+    @staticmethod
+    def normalize_url(url):
+        return url.rstrip(URL_TRAILING_CHARS).removesuffix(".git").rstrip("/")
+
+    def resolve(self, url):
+        """
+        Return (kind, request URL, headers) used to validate a theme URL, or None if unsupported.
+        """
+        url = self.normalize_url(url)
+        github = re.match(r'https?://github\.com/([^/\s]+)/([^/\s#?]+)', url)
+        if github:
+            return "github", f"{self.github_api_url}/repos/{github.group(1)}/{github.group(2)}", self.github_headers
+        gitlab = re.match(r'https?://gitlab\.com/([^\s#?]+)', url)
+        if gitlab:
+            project = gitlab.group(1).split("/-/")[0]
+            return "gitlab", f"{self.gitlab_api_url}/projects/{quote(project, safe='')}", {}
+        if 'themes.gohugo.io' in url or 'hugohub.com' in url:
+            return "page", url, {}
+        return None
+
+    def validate(self, url):
+        """
+        Return True if the URL points to an existing theme repository (or a theme page linking to one).
+        Every fresh result is written to the cache file as soon as it is known.
+        """
+        url = self.normalize_url(url)
+        resolved = self.resolve(url)
+        if resolved is None:
+            return False
+        kind, request_url, headers = resolved
+
+        with self._lock:
+            entry = dict(self.cache.get(url) or {})
+        if entry:
+            ttl = POSITIVE_TTL if entry["valid"] else NEGATIVE_TTL
+            if time.time() - entry["checked"] < ttl:
+                return entry["valid"]
+            if entry.get("etag"):
+                headers = dict(headers, **{"If-None-Match": entry["etag"]})
+
+        with span("theme.validate", **{"http.url": request_url}) as current:
+            try:
+                response = self.session.get(request_url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Error validating {url}: {e}")
+                current.status = "error"
+                return entry.get("valid", False)  # Keep the last known answer on network errors
+            current.set(**{"http.status_code": response.status_code, "http.bytes": len(response.content)})
+
+        if response.status_code == 304 and entry:
+            valid = entry["valid"]
+        elif kind == "page":
+            valid = response.status_code == 200 and self.page_links_repository(response.text)
+        else:
+            valid = response.status_code == 200
+
+        with self._lock:
+            self.cache[url] = {"valid": valid, "etag": response.headers.get("ETag") or entry.get("etag"), "checked": time.time()}
+        self.save_cache()
+        print(f"{'Valid' if valid else 'Invalid'} theme source: {url}")
+        return valid
+
+    @staticmethod
+    def page_links_repository(html):
+        # Basic validation: check if a link to a GitHub repository exists in the theme page
+        soup = BeautifulSoup(html, 'html.parser')
+        return soup.find('a', href=re.compile(r'https://github.com/')) is not None
+
+    def first_valid(self, urls):
+        """
+        Validate the URLs concurrently and return the first one found valid, or None.
+        Checks that have not started yet are cancelled once a valid URL is found; checks already
+        running finish in the background and still record their result in the cache.
+        """
+        candidates = list(dict.fromkeys(self.normalize_url(url) for url in urls if self.resolve(url)))
+        if not candidates:
+            return None
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(candidates)))
+        futures = {executor.submit(contextvars.copy_context().run, self.validate, url): url for url in candidates}
+        found = None
+        try:
+            pending = set(futures)
+            while pending and found is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # Prefer the earliest suggestion among the checks that finished together
+                for future in sorted(done, key=lambda future: candidates.index(futures[future])):
+                    if future.result():
+                        found = futures[future]
+                        break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return found
+
+_default_validator = None
+
+def get_default_validator():
+    """
+    Return the process-wide validator so all ThemeManagers share one connection pool and cache.
+    """
+    global _default_validator
+    if _default_validator is None:
+        _default_validator = ThemeValidator()
+    return _default_validator
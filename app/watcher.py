@@ -0,0 +1,345 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from site_index import STACK_MARKERS, SiteIndex
+from deploy import deploy, remove_services, restart_services
+from server import COMPOSE_FILE, generate_docker_compose
+from static_build import OUTPUT_DIRS, BuildFarm
+from utils.tracing import span
+
+# Base directory where websites are stored
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
+
+# Seconds without new events before a burst of changes is applied
+DEBOUNCE_SECONDS = float(os.environ.get("WATCH_DEBOUNCE", 2))
+
+# Upper bound on how long a continuous stream of changes can delay an update
+MAX_DELAY_SECONDS = float(os.environ.get("WATCH_MAX_DELAY", 10))
+
+# Seconds between two walks of the tree when inotify is unavailable
+POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", 2))
+
+# Set WATCH_POLLING=1 to skip inotify (e.g. on network filesystems that do not report changes)
+FORCE_POLLING = os.environ.get("WATCH_POLLING", "0").lower() in ("1", "true", "yes")
+
+# Stacks whose container serves the mounted files with live reload and needs no restart on edits
+LIVE_RELOAD_STACKS = {"hugo"}
+
+# Dependency trees, ignored wherever they are
+IGNORED_DIRS = {"node_modules"}
+
+# Build output of each stack, ignored only directly under a site of that stack: a Next.js site's
+# public/ holds source assets, while a Hugo site's public/ is build output
+STACK_IGNORED_DIRS = {"hugo": {OUTPUT_DIRS["hugo"], "resources"}, "next.js": {OUTPUT_DIRS["next.js"]}}
+
+# inotify(7) event masks
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+def site_stack(directory):
+    """
+    Return the stack of the site rooted at directory, or None if it is not a site.
+    """
+    for marker, stack in STACK_MARKERS:
+        if os.path.isfile(os.path.join(directory, marker)):
+            return stack
+    return None
+
+def ignored_names(directory):
+    """
+    Return the names of the child directories of directory whose subtrees are never watched.
+    """
+    return IGNORED_DIRS | STACK_IGNORED_DIRS.get(site_stack(directory), set())
+
+def is_ignored(base_dir, path):
+    """
+    Return True for paths that never affect what is served: internal dot-directories and files,
+    dependencies, and the build output directory of the site they are in.
+    """
+    relative = os.path.relpath(path, base_dir)
+    if relative == ".":
+        return False
+    parts = relative.split(os.sep)
+    if any(part.startswith(".") or part in IGNORED_DIRS for part in parts):
+        return True
+    output_names = set().union(*STACK_IGNORED_DIRS.values())
+    return any(part in output_names and part in STACK_IGNORED_DIRS.get(site_stack(os.path.join(base_dir, *parts[:index])), ())
+               for index, part in enumerate(parts))
+
+class InotifyWatcher:
+    def __init__(self, base_dir=BASE_DIR):
+        """
+        Recursive inotify watch of base_dir. Raises OSError when inotify is unavailable or the
+        watch limit (fs.inotify.max_user_watches) is too low for the tree.
+        """
+        self.base_dir = base_dir
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}  # watch descriptor -> directory
+        try:
+            self.add_tree(base_dir)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, root):
+        for dirpath, dirnames, _ in os.walk(root):
+            if is_ignored(self.base_dir, dirpath):
+                dirnames[:] = []
+                continue
+            ignored = ignored_names(dirpath)
+            dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".") and dirname not in ignored]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # Removed while walking
+                raise OSError(error, f"inotify_add_watch failed for {dirpath}")
+            self.paths[wd] = dirpath
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds and return the set of changed paths.
+        A queue overflow reports base_dir itself, which stands for "anything may have changed".
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 256 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.add(self.base_dir)
+                continue
+            directory = self.paths.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.paths[wd]
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if is_ignored(self.base_dir, path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    def __init__(self, base_dir=BASE_DIR, interval=POLL_INTERVAL):
+        """
+        Fallback watcher that walks the tree every `interval` seconds and reports the files and
+        directories whose mtime or size changed, appeared or disappeared.
+        """
+        self.base_dir = base_dir
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+        self.next_poll = time.monotonic() + interval
+
+    def take_snapshot(self):
+        snapshot = {}
+        pending = [self.base_dir]
+        while pending:
+            path = pending.pop()
+            try:
+                entries = list(os.scandir(path))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            ignored = ignored_names(path)
+            for entry in entries:
+                if entry.name.startswith(".") or entry.is_dir(follow_symlinks=False) and entry.name in ignored:
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime, stat.st_size)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+        return snapshot
+
+    def wait(self, timeout):
+        delay = self.next_poll - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(delay, 0))
+        self.next_poll = time.monotonic() + self.interval
+
+        snapshot = self.take_snapshot()
+        changed = {path for path, state in snapshot.items() if self.snapshot.get(path) != state}
+        changed.update(path for path in self.snapshot if path not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+def make_watcher(base_dir=BASE_DIR, polling=FORCE_POLLING):
+    """
+    Return an inotify watcher, or a polling watcher when inotify cannot be used.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(base_dir)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), polling every {POLL_INTERVAL}s instead")
+    return PollingWatcher(base_dir)
+
+def service_name(site):
+    return f"{site['stack']}_{site['name']}"
+
+class LiveRedeployer:
+    def __init__(self, compose_file=COMPOSE_FILE, base_dir=BASE_DIR, index=None, debounce=DEBOUNCE_SECONDS,
+                 max_delay=MAX_DELAY_SECONDS, parallel=None, static=False, unbuilt=()):
+        """
+        Apply filesystem changes under base_dir to the running fleet, one site at a time: only the
+        changed site's index entry is refreshed, and only its compose service and container are
+        (re)deployed, removed or restarted. With static=True the changed site is rebuilt instead;
+        the shared static server picks up new routes from the index by itself. Sites whose build
+        failed (`unbuilt`, their paths) are served by their dev service until a build succeeds.
+        """
+        self.compose_file = compose_file
+        self.base_dir = base_dir
+        self.index = index or SiteIndex(base_dir)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.parallel = parallel
+        self.static = static
+        self.builds = BuildFarm() if static else None
+        self.unbuilt = set(unbuilt)
+
+    def apply(self, paths):
+        """
+        Refresh the sites affected by a batch of changed paths and update their services.
+        Returns {"added", "removed", "updated"} lists of service names.
+        """
+        if self.base_dir in paths:
+            roots = {self.base_dir}  # Events were lost; refresh the whole index
+        else:
+            roots = {root for root in (self.index.locate(path) for path in paths) if root is not None}
+        # A directory refresh already covers everything below it
+        roots = {root for root in roots if not any(root.startswith(other + os.sep) for other in roots)}
+        result = {"added": [], "removed": [], "updated": []}
+        if not roots:
+            return result
+
+        with span("watch.apply", **{"watch.paths": len(paths), "watch.roots": len(roots)}):
+            changes = {"added": [], "removed": [], "kept": []}
+            for root in sorted(roots):
+                for key, sites in self.index.refresh(root).items():
+                    changes[key].extend(sites)
+
+            added = [service_name(site) for site in changes["added"]]
+            removed = [service_name(site) for site in changes["removed"]]
+            updated = [service_name(site) for site in changes["kept"]]
+            if self.static:
+                self.rebuild(changes)
+            else:
+                self.redeploy(changes)
+
+        result = {"added": added, "removed": removed, "updated": updated}
+        print(f"Applied changes: {len(added)} added, {len(removed)} removed, {len(updated)} updated "
+              f"({', '.join(added + removed + updated) or 'no sites'})")
+        return result
+
+    def rebuild(self, changes):
+        results = self.builds.build_all(changes["added"] + changes["kept"])
+        unbuilt = {path for path, result in results.items() if result["output_dir"] is None}
+        built = set(results) - unbuilt
+        removed = {site["path"] for site in changes["removed"]}
+        if self.unbuilt & (built | removed) or unbuilt - self.unbuilt:
+            # The set of sites served by a dev service changed
+            self.unbuilt = (self.unbuilt - built - removed) | unbuilt
+            websites = [{"name": site["name"], "stack": site["stack"], "path": site["path"]} for site in self.index.sites()]
+            diff = generate_docker_compose(websites, self.compose_file, static=True, unbuilt=self.unbuilt)
+            remove_services(diff["removed"])
+            if diff["added"] or diff["changed"]:
+                deploy(self.compose_file, diff["added"] + diff["changed"], parallel=self.parallel, remove_orphans=False)
+
+    def redeploy(self, changes):
+        websites = [{"name": site["name"], "stack": site["stack"], "path": site["path"]} for site in self.index.sites()]
+        diff = generate_docker_compose(websites, self.compose_file)
+        remove_services([service_name(site) for site in changes["removed"]])
+
+        redefined = set(diff["added"] + diff["changed"])
+        to_deploy = ([service_name(site) for site in changes["added"]]
+                     + [service_name(site) for site in changes["kept"] if service_name(site) in redefined])
+        if to_deploy:
+            deploy(self.compose_file, to_deploy, parallel=self.parallel, remove_orphans=False)
+        restart_services(self.compose_file, [service_name(site) for site in changes["kept"]
+                                             if service_name(site) not in redefined
+                                             and site["stack"] not in LIVE_RELOAD_STACKS])
+
+    def run(self, watcher=None, stop=None):
+        """
+        Watch base_dir until interrupted (or until `stop`, a threading.Event, is set). Bursts of
+        events are collected until none arrived for `debounce` seconds, or for at most `max_delay`.
+        If the watcher fails (OSError), watching continues with a PollingWatcher.
+        """
+        watcher = watcher or make_watcher(self.base_dir)
+        print(f"Watching {self.base_dir} for changes ({type(watcher).__name__})")
+        pending = set()
+        first = last = None
+        try:
+            while stop is None or not stop.is_set():
+                timeout = self.debounce if pending else 1.0
+                try:
+                    paths = watcher.wait(timeout)
+                except OSError as e:
+                    # e.g. inotify hit max_user_watches on a large new site: keep watching by polling
+                    if isinstance(watcher, PollingWatcher):
+                        print(f"Watching failed ({e}); retrying")
+                        time.sleep(timeout)
+                    else:
+                        print(f"Watching failed ({e}); polling every {POLL_INTERVAL}s instead")
+                        watcher.close()
+                        watcher = PollingWatcher(self.base_dir)
+                    paths = {self.base_dir}  # Events may have been lost; refresh the whole index
+                now = time.monotonic()
+                if paths:
+                    pending |= paths
+                    first = first or now
+                    last = now
+                if pending and (now - last >= self.debounce or now - first >= self.max_delay):
+                    batch, pending = pending, set()
+                    first = last = None
+                    try:
+                        self.apply(batch)
+                    except Exception as e:
+                        print(f"Failed to apply changes: {e}")
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            watcher.close()
@@ -1,11 +1,16 @@
 import os
 import subprocess  # This import was missing earlier
-import sys
 import toml  # To handle .toml configuration files for Hugo
 import json  # To handle .json configuration files for Next.js
+from npm_store import npm_env
+from content_pipeline import write_pages
+from content_store import ContentStore
+from image_pipeline import add_page_images
+from scaffold_templates import TemplateStore, scaffold_command, templates_enabled
+from utils.tracing import span, traced_run
 
 # Base directory where websites are stored
-BASE_DIR = "/mnt/sites"
+BASE_DIR = os.environ.get("SITES_DIR", "/mnt/sites")
 
 class Website:
     def __init__(self, stack, website_name, shared_content):
@@ -15,6 +20,12 @@ class Website:
         """
         self.stack = stack
         self.website_name = website_name.lower().replace(" ", "-")  # Convert to kebab-case for directory naming
+        # The name becomes a directory that reset deletes; refuse names that resolve outside BASE_DIR
+        base_dir = os.path.realpath(BASE_DIR)
+        website_dir = os.path.realpath(self.get_website_dir())
+        if (self.website_name in ("", ".", "..") or os.sep in self.website_name
+                or os.path.commonpath([base_dir, website_dir]) != base_dir or website_dir == base_dir):
+            raise ValueError(f"Invalid website name: {website_name!r}")
         self.shared_content = shared_content
         self.config_file = None  # This will hold the reference to the config file
 
@@ -53,46 +64,82 @@ class Website:
         except FileNotFoundError:
             return False
 
-    def initialize_stack(self, reset=False):
+    def get_website_dir(self):
         """
-        Initialize the website stack based on the stack type using subprocess.
-        If reset=True, the stack will be re-initialized.
+        Return the directory holding this website.
         """
-        website_dir = f"{BASE_DIR}/{self.stack}/{self.website_name}"
+        return f"{BASE_DIR}/{self.stack}/{self.website_name}"
 
-        try:
-            # Check if the directory exists and is not empty
-            if os.path.exists(website_dir) and os.listdir(website_dir):
-                if reset:
+    def get_scaffold_command(self):
+        """
+        Return the command that scaffolds a new site for this stack.
+        """
+        return scaffold_command(self.stack, self.get_website_dir())
+
+    def scaffold(self, log=None):
+        """
+        Create the site files. By default the site is cloned from the pre-built stack template
+        (built on first use, with its output written to `log` when given); set
+        SCAFFOLD_USE_TEMPLATES=0 to run hugo/npx for every site.
+        """
+        if templates_enabled():
+            with span("scaffold.clone", **{"site.stack": self.stack, "site.name": self.website_name}):
+                TemplateStore().clone(self.stack, self.get_website_dir(), log=log)
+        else:
+            traced_run("scaffold.command", self.get_scaffold_command(), check=True, env=npm_env())
+
+    def prepare_directory(self, reset=False, interactive=True):
+        """
+        Make sure the website directory can be scaffolded into. Returns False if initialization should be skipped.
+        With interactive=False an existing, non-empty directory is skipped instead of prompting.
+        """
+        website_dir = self.get_website_dir()
+
+        # Check if the directory exists and is not empty
+        if os.path.exists(website_dir) and os.listdir(website_dir):
+            if reset:
+                print(f"Resetting {self.stack} at {website_dir}...")
+                subprocess.run(["rm", "-rf", website_dir], check=True)
+            elif not interactive:
+                print(f"Skipping initialization for {self.stack}: {website_dir} already exists.")
+                return False
+            else:
+                # Prompt the user for an action if directory exists and is not empty
+                choice = input(f"The directory '{website_dir}' already exists and is not empty. Would you like to reset (1) or skip (2)? ")
+                if choice == "1":
                     print(f"Resetting {self.stack} at {website_dir}...")
                     subprocess.run(["rm", "-rf", website_dir], check=True)
                 else:
-                    # Prompt the user for an action if directory exists and is not empty
-                    choice = input(f"The directory '{website_dir}' already exists and is not empty. Would you like to reset (1) or skip (2)? ")
-                    if choice == "1":
-                        print(f"Resetting {self.stack} at {website_dir}...")
-                        subprocess.run(["rm", "-rf", website_dir], check=True)
-                    else:
-                        print(f"Skipping initialization for {self.stack}.")
-                        return
+                    print(f"Skipping initialization for {self.stack}.")
+                    return False
+        return True
+
+    def initialize_stack(self, reset=False, interactive=True):
+        """
+        Initialize the website stack based on the stack type using subprocess.
+        If reset=True, the stack will be re-initialized.
+        Returns True on success, False if scaffolding failed and None if initialization was skipped.
+        """
+        website_dir = self.get_website_dir()
+
+        try:
+            if not self.prepare_directory(reset=reset, interactive=interactive):
+                return None
 
             if self.stack == "hugo":
                 print(f"Initializing Hugo site at {website_dir}...")
-                subprocess.run(["hugo", "new", "site", website_dir], check=True)
-
             elif self.stack == "next.js":
                 print(f"Initializing Next.js app at {website_dir} using npx...")
-                subprocess.run(["npx", "create-next-app", website_dir], check=True)
-
-            else:
-                raise ValueError(f"Unsupported stack: {self.stack}")
+            self.scaffold()
 
             # After initialization, set the config_file reference
             self.get_config_file()
+            return True
 
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, OSError) as e:
+            # Report the failure to the caller instead of exiting, so other sites and stacks can continue
             print(f"Error initializing {self.stack}: {e}")
-            sys.exit(1)  # Gracefully exit on error
+            return False
 
     def initializer(self, reset=False):
         """
@@ -116,14 +163,31 @@ class Website:
 
     def get_shared_content(self):
         """
-        Placeholder method to handle shared content retrieval.
-        In a complete implementation, this would manage shared content between different stacks.
+        Return the stack-neutral content of this website: the content it was given, otherwise the
+        copy stored by the last generation for any stack (None if the site was never generated).
         """
-        pass  # Implement shared content logic if necessary
+        if self.shared_content is None:
+            self.shared_content = ContentStore().load(self.website_name)
+        return self.shared_content
 
-    def modify_website(self):
+    def write_content(self):
+        """
+        Render the shared content with this stack's renderer into the site's page files.
+        Returns the written files.
+        """
+        content = self.get_shared_content()
+        if not content:
+            return []
+        add_page_images(self.stack, self.get_website_dir(), content)
+        files = write_pages(self.stack, self.get_website_dir(), content)
+        print(f"Wrote {len(files)} page(s) to the {self.stack} site {self.website_name}.")
+        return files
+
+    def modify_website(self, pipeline, pages=(), force=False):
         """
-        Placeholder method for modifying existing website content.
+        Update the content of an existing website incrementally with a ContentPipeline: only pages
+        whose prompt changed, that are missing, or that are listed in `pages` are regenerated.
+        Hand-edited pages are kept unless force=True. Returns the pipeline's update report.
         """
         print(f"Modifying website content for {self.website_name} on stack {self.stack}.")
-        # Implement the logic to modify the website here.
+        return pipeline.update(self.stack, self.get_website_dir(), targets=pages, force=force)
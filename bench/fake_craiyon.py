@@ -0,0 +1,104 @@
+import argparse
+import hashlib
+import io
+import json
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def make_png(seed, width, height):
+    """
+    Return a solid-colour PNG whose colour is derived from seed, built without any imaging library.
+    """
+    red, green, blue = hashlib.sha256(seed.encode("utf-8")).digest()[:3]
+    row = b"\x00" + bytes((red, green, blue)) * width
+    raw = row * height
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+class FakeCraiyonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.5, images=9, size=(1024, 1024)):
+        """
+        Stand-in for the Craiyon v3 API used through CRAIYON_API_URL. POST /v3 waits `latency`
+        seconds and returns `images` paths; GET on a path returns a PNG derived from the prompt.
+        """
+        super().__init__(address, FakeCraiyonHandler)
+        self.latency = latency
+        self.images = images
+        self.size = size
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class FakeCraiyonHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with server._lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+
+        seed = hashlib.sha256(request.get("prompt", "").encode("utf-8")).hexdigest()[:16]
+        body = json.dumps({"images": [f"generated/{seed}-{index}.png" for index in range(server.images)],
+                           "next_prompt": request.get("prompt", "")}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.path.startswith("/generated/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = make_png(self.path, *self.server.size)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Send in pieces so clients exercise streaming
+        stream = io.BytesIO(body)
+        for piece in iter(lambda: stream.read(16 * 1024), b""):
+            self.wfile.write(piece)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Craiyon API for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per generation")
+    args = parser.parse_args()
+
+    server = FakeCraiyonServer((args.host, args.port), latency=args.latency)
+    print(f"Fake Craiyon listening on {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
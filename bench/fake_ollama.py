@@ -0,0 +1,182 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua").split()
+
+def example_for_schema(schema, text):
+    """
+    Build a minimal JSON value matching a JSON schema, filling strings with the generated text.
+    Arrays get two items so list handling is exercised.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: f"page-{text.split()[-1]}" if key == "slug" else example_for_schema(value, text)
+                for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [example_for_schema(schema.get("items", {}), f"{text} {index}") for index in range(2)]
+    if kind in ("integer", "number"):
+        return 1
+    if kind == "boolean":
+        return True
+    return text
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.05, tokens_per_sec=200.0, tokens=100, models=("llama3.1",),
+                 load_seconds=0.0):
+        """
+        Minimal stand-in for the Ollama HTTP API (/api/chat, /api/generate, /api/tags, /api/ps).
+        Each request waits `latency` seconds before the first token, then produces `tokens`
+        words at `tokens_per_sec`, streamed as NDJSON when the request asks for it. A request for
+        a model that is not loaded first waits `load_seconds`, reported as load_duration.
+        An empty /api/generate prompt only loads the model, as in Ollama.
+        """
+        super().__init__(address, FakeOllamaHandler)
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.tokens = tokens
+        self.models = list(models)
+        self.load_seconds = load_seconds
+        self.loaded = set()
+        self.keep_alive = {}  # model -> keep_alive of the last request
+        self.requests = 0
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def unload(self, model):
+        # Simulates the server evicting an idle model
+        with self._lock:
+            self.loaded.discard(f"{model}:latest" if ":" not in model else model)
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({"models": [{"name": model, "model": model} for model in self.server.models]})
+        elif self.path == "/api/ps":
+            self.send_json({"models": [{"name": model, "model": model} for model in sorted(self.server.loaded)]})
+        elif self.path == "/api/version":
+            self.send_json({"version": "0.0.0-fake"})
+        else:
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.path == "/api/chat":
+            self.generate(request, chat=True)
+        elif self.path == "/api/generate":
+            self.generate(request, chat=False)
+        elif self.path == "/api/pull":
+            self.send_json({"status": "success"})
+        else:
+            self.send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def generate(self, request, chat):
+        server = self.server
+        model = request.get("model", "llama3.1")
+        tag = model if ":" in model else f"{model}:latest"
+        started = time.time()
+        with server._lock:
+            server.requests += 1
+            cold = tag not in server.loaded
+            if "keep_alive" in request:
+                server.keep_alive[model] = request["keep_alive"]
+        if cold:
+            time.sleep(server.load_seconds)
+            with server._lock:
+                server.loads += 1
+                server.loaded.add(tag)
+        load_duration = int((time.time() - started) * 1e9)
+
+        if not chat and not request.get("prompt"):
+            self.send_json({"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "response": "",
+                            "done": True, "done_reason": "load", "total_duration": load_duration,
+                            "load_duration": load_duration})
+            return
+
+        time.sleep(server.latency)
+        words = [WORDS[index % len(WORDS)] for index in range(server.tokens)]
+        if isinstance(request.get("format"), dict):
+            words = [json.dumps(example_for_schema(request["format"], " ".join(words)))]
+        elif request.get("format"):
+            words = [json.dumps({"text": " ".join(words)})]
+        delay = 1.0 / server.tokens_per_sec if server.tokens_per_sec else 0
+
+        def chunk(text, done):
+            payload = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update({"done_reason": "stop", "total_duration": int((time.time() - started) * 1e9),
+                                "load_duration": load_duration,
+                                "eval_count": len(words), "eval_duration": int(len(words) * delay * 1e9)})
+            return payload
+
+        if request.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for index, word in enumerate(words):
+                time.sleep(delay)
+                self.wfile.write((json.dumps(chunk(word if index == 0 else f" {word}", False)) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write((json.dumps(chunk("", True)) + "\n").encode("utf-8"))
+        else:
+            time.sleep(delay * len(words))
+            self.send_json(chunk(" ".join(words), True))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for benchmarks and local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=100, help="Tokens per response")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Seconds to load a model that is not in memory")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer((args.host, args.port), latency=args.latency, tokens_per_sec=args.tokens_per_sec, tokens=args.tokens,
+                              load_seconds=args.load_seconds)
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SHIMS_DIR = os.path.join(BENCH_DIR, "shims")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "HEAD"], capture_output=True, text=True,
+                              env=dict(os.environ, PATH=os.defpath)).stdout.strip() or None
+    except OSError:
+        return None
+
+def timed(function, repeat=1):
+    """
+    Run function `repeat` times with its output silenced and return (best seconds, last result).
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def make_site_tree(base_dir, count):
+    """
+    Create `count` synthetic sites, alternating Hugo and Next.js, each with a populated node_modules or themes tree.
+    """
+    for index in range(count):
+        if index % 2:
+            site_dir = os.path.join(base_dir, "hugo", f"site-{index}")
+            os.makedirs(os.path.join(site_dir, "themes", "ananke", "layouts"))
+            open(os.path.join(site_dir, "hugo.toml"), "w").close()
+        else:
+            site_dir = os.path.join(base_dir, "next.js", f"site-{index}")
+            os.makedirs(os.path.join(site_dir, "node_modules", "next", "dist"))
+            open(os.path.join(site_dir, "next.config.js"), "w").close()
+
+def bench_generation(results, args):
+    import batch
+    import utils.ollama_cache as ollama_cache
+
+    site = {"name": "Bench Site", "type": "business", "description": "A benchmark site", "stacks": "all", "action": "reset"}
+    scaffolder = batch.ParallelScaffolder(echo=False)
+    ollama_cache.get_default_cache().clear()
+    seconds, result = timed(lambda: batch.process_site(site, scaffolder))
+    results.append({"benchmark": "generate_site", "params": {"cache": "cold"}, "seconds": seconds, "status": result["status"]})
+    seconds, result = timed(lambda: batch.process_site(site, scaffolder), repeat=args.repeat)
+    results.append({"benchmark": "generate_site", "params": {"cache": "warm"}, "seconds": seconds, "status": result["status"]})
+    scaffolder.shutdown()
+
+def bench_detection_and_compose(results, args, work_dir):
+    import server
+
+    for count in args.sites:
+        base_dir = os.path.join(work_dir, f"tree-{count}")
+        make_site_tree(base_dir, count)
+
+        seconds, websites = timed(lambda: server.detect_website_stacks(base_dir, use_index=False))
+        results.append({"benchmark": "detect_website_stacks", "params": {"sites": count, "mode": "walk"}, "seconds": seconds})
+        seconds, _ = timed(lambda: server.detect_website_stacks(base_dir))
+        results.append({"benchmark": "detect_website_stacks", "params": {"sites": count, "mode": "index-cold"}, "seconds": seconds})
+        seconds, _ = timed(lambda: server.detect_website_stacks(base_dir), repeat=args.repeat)
+        results.append({"benchmark": "detect_website_stacks", "params": {"sites": count, "mode": "index-warm"}, "seconds": seconds})
+
+        compose_file = os.path.join(base_dir, "compose", "docker-compose.generated.yml")
+        seconds, _ = timed(lambda: server.generate_docker_compose(websites, output_file=compose_file))
+        results.append({"benchmark": "generate_docker_compose", "params": {"sites": count, "mode": "new"}, "seconds": seconds})
+        seconds, _ = timed(lambda: server.generate_docker_compose(websites, output_file=compose_file), repeat=args.repeat)
+        results.append({"benchmark": "generate_docker_compose", "params": {"sites": count, "mode": "unchanged"}, "seconds": seconds})
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def bench_theme_switch(results, args):
+    from theme_manager import ThemeManager
+    from website import Website
+
+    website = Website(stack="hugo", website_name="theme-bench", shared_content=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        website.initialize_stack(reset=True, interactive=False)
+    theme_manager = ThemeManager("hugo", website.website_name, interactive=False)
+    themes = iter(["ananke", "papermod"] * (args.repeat + 1))
+    seconds, _ = timed(lambda: theme_manager.change_theme(next(themes)), repeat=args.repeat)
+    results.append({"benchmark": "change_theme", "params": {"stack": "hugo"}, "seconds": seconds})
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the website generator against a fake Ollama server and tool shims.")
+    parser.add_argument("--sites", default="10,100,1000,10000", help="Comma-separated synthetic tree sizes")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake Ollama time to first token (seconds)")
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0, help="Fake Ollama token rate")
+    parser.add_argument("--tokens", type=int, default=100, help="Tokens per fake response")
+    parser.add_argument("--backends", type=int, default=1, help="Number of fake Ollama servers behind the client pool")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions for warm measurements (best is kept)")
+    parser.add_argument("--only", help="Comma-separated subset: generation, detection, theme")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    args.sites = [int(count) for count in args.sites.split(",") if count]
+    selected = set(args.only.split(",")) if args.only else {"generation", "detection", "theme"}
+
+    work_dir = tempfile.mkdtemp(prefix="website-generator-bench-")
+    sys.path.insert(0, BENCH_DIR)
+    from fake_ollama import FakeOllamaServer
+    servers = [FakeOllamaServer(latency=args.latency, tokens_per_sec=args.tokens_per_sec, tokens=args.tokens).start()
+               for _ in range(max(1, args.backends))]
+    server = servers[0]
+
+    # Configure the environment before the app modules read it at import time
+    os.environ.update({
+        "SITES_DIR": os.path.join(work_dir, "sites"),
+        "OLLAMA_HOST": server.url,
+        "OLLAMA_HOSTS": ",".join(backend.url for backend in servers),
+        "PATH": SHIMS_DIR + os.pathsep + os.environ.get("PATH", ""),
+        "GITHUB_API_URL": server.url,
+        "GITLAB_API_URL": server.url,
+    })
+    sys.path[:0] = [os.path.join(REPO_DIR, "app"), REPO_DIR]
+
+    results = []
+    try:
+        if "generation" in selected:
+            bench_generation(results, args)
+        if "detection" in selected:
+            bench_detection_and_compose(results, args, work_dir)
+        if "theme" in selected:
+            bench_theme_switch(results, args)
+    finally:
+        for backend in servers:
+            backend.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {"latency": args.latency, "tokens_per_sec": args.tokens_per_sec, "tokens": args.tokens, "repeat": args.repeat,
+                   "backends": len(servers)},
+        "results": [dict(result, seconds=round(result["seconds"], 6)) for result in results],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,67 @@
+import os
+import threading
 import craiyon
+import requests
+from requests.adapters import HTTPAdapter
+
+# Craiyon API endpoint; unset uses the public service
+CRAIYON_API_URL = os.environ.get("CRAIYON_API_URL")
+
+# Where image paths returned by the API are downloaded from (defaults to the API server itself
+# when CRAIYON_API_URL is set, since the client library assumes the public image host)
+CRAIYON_IMAGE_URL = os.environ.get("CRAIYON_IMAGE_URL", CRAIYON_API_URL or "https://img.craiyon.com")
+
+PUBLIC_IMAGE_HOST = "https://img.craiyon.com/"
+
+_client = None
+_session = None
+_lock = threading.Lock()
+
+def get_craiyon_client():
+    """
+    Return the process-wide Craiyon client, pointed at CRAIYON_API_URL when it is set.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = craiyon.Craiyon()
+            if CRAIYON_API_URL:
+                _client.BASE_URL = CRAIYON_API_URL.rstrip("/")
+        return _client
+
+def get_image_session():
+    """
+    Return the process-wide HTTP session used to download images, with a keep-alive pool.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def image_url(url):
+    # The client library prefixes every returned path with the public image host
+    if url.startswith(PUBLIC_IMAGE_HOST):
+        return f"{CRAIYON_IMAGE_URL.rstrip('/')}/{url[len(PUBLIC_IMAGE_HOST):]}"
+    return url
 
 def generate_image_with_craiyon(prompt):
-    generator = craiyon.Craiyon()
-    result = generator.generate(prompt)
-    return result.images
+    """
+    Generate images for a prompt and return their download URLs.
+    """
+    result = get_craiyon_client().generate(prompt)
+    return [image_url(url) for url in result.images]
 
+def download_image(url, file, chunk_size=64 * 1024):
+    """
+    Stream an image into an open binary file without holding it in memory.
+    Returns the response's Content-Type.
+    """
+    with get_image_session().get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size):
+            file.write(chunk)
+        return response.headers.get("Content-Type", "")
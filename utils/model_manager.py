@@ -0,0 +1,224 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import ollama
+
+from utils.ollama_pool import OllamaPool, model_tag
+from utils.tracing import span
+
+# Model used when a caller does not ask for one
+DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.1")
+
+# Models preloaded at startup and kept resident
+MODELS = [model.strip() for model in os.environ.get("OLLAMA_MODELS", DEFAULT_MODEL).split(",") if model.strip()]
+
+# How long Ollama keeps a model in memory after a request: seconds, a duration such as "30m",
+# or -1 to pin it until the server restarts
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "-1")
+
+# Seconds between /api/ps probes that reload evicted models in the background
+PROBE_INTERVAL = float(os.environ.get("OLLAMA_PROBE_INTERVAL", 60))
+
+# A request whose load_duration exceeds this waited on a model load
+COLD_LOAD_SECONDS = 0.5
+
+def parse_keep_alive(value):
+    # Ollama reads bare numbers as seconds, but strings only as Go durations ("-1" is rejected)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def _field(response, key):
+    try:
+        return response[key]
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+class ModelManager:
+    def __init__(self, models=None, keep_alive=KEEP_ALIVE, hosts=None):
+        """
+        Lifecycle of the Ollama models the generator uses: preloads them on every backend of the
+        pool, pins them in memory with keep_alive on every request, reloads them in the background
+        when they get evicted, and records whether each request was served warm or waited on a load.
+        """
+        self.models = list(models or MODELS)
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.pool = OllamaPool(hosts)
+        self.latency = {}  # model -> {"cold": [count, seconds], "warm": [count, seconds]}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keeper = None
+
+    def async_client(self):
+        return self.pool.async_client()
+
+    def probe(self, backend):
+        """
+        Return the tags of the models loaded on a backend, or None when it cannot be reached.
+        Uses GET /api/ps, which runs no inference, and feeds the result to the pool's routing.
+        """
+        try:
+            response = backend.client.ps()
+        except Exception as e:
+            self.pool.update_backend(backend, error=e)
+            return None
+        loaded = {_field(model, "model") or _field(model, "name") for model in _field(response, "models") or []}
+        self.pool.update_backend(backend, loaded=loaded)
+        return loaded
+
+    def loaded_models(self):
+        """
+        Return the tags of the models loaded on at least one backend.
+        """
+        loaded = set()
+        for backend in self.pool.backends:
+            loaded |= self.probe(backend) or set()
+        return loaded
+
+    def is_ready(self, models=None):
+        """
+        Readiness probe: True when every managed model is loaded on at least one backend, False
+        otherwise or when no backend can be reached.
+        """
+        loaded = self.loaded_models()
+        return all(model_tag(model) in loaded for model in models or self.models)
+
+    def preload(self, models=None, backends=None):
+        """
+        Load models with an empty request (no tokens are generated) and pin them with keep_alive,
+        on every backend unless `backends` is given. Models missing on a backend are pulled first.
+        Returns {host: {model: seconds}}; unreachable backends are reported and skipped.
+        """
+        timings = {}
+        for backend in backends or self.pool.backends:
+            for model in models or self.models:
+                with span("llm.preload", **{"llm.model": model, "llm.backend": backend.host}) as current:
+                    started = time.perf_counter()
+                    try:
+                        try:
+                            backend.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+                        except ollama.ResponseError as e:
+                            if e.status_code != 404:
+                                raise
+                            print(f"Pulling model {model} on {backend.host}...")
+                            backend.client.pull(model)
+                            backend.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+                    except Exception as e:
+                        print(f"Could not load {model} on {backend.host}: {e}")
+                        self.pool.update_backend(backend, error=e)
+                        current.set(error=str(e))
+                        break
+                    timings.setdefault(backend.host, {})[model] = round(time.perf_counter() - started, 3)
+                    current.set(**{"llm.load_seconds": timings[backend.host][model]})
+        return timings
+
+    def ensure_loaded(self):
+        """
+        Reload the managed models that are not in memory on each reachable backend.
+        Returns the loaded models as "model@host".
+        """
+        reloaded = []
+        for backend in self.pool.backends:
+            loaded = self.probe(backend)
+            if loaded is None:
+                continue
+            missing = [model for model in self.models if model_tag(model) not in loaded]
+            if missing:
+                self.preload(missing, [backend])
+                self.probe(backend)
+                reloaded.extend(f"{model}@{backend.host}" for model in missing)
+        return reloaded
+
+    def start(self, interval=PROBE_INTERVAL):
+        """
+        Preload the models in a background thread, then probe /api/ps every `interval` seconds and
+        reload any model the server evicted. Returns at once so startup never waits on a load.
+        """
+        if self._keeper is None:
+            self._keeper = threading.Thread(target=self._keep_warm, args=(interval,), name="model-keeper", daemon=True)
+            self._keeper.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _keep_warm(self, interval):
+        while not self._stop.is_set():
+            try:
+                loaded = self.ensure_loaded()
+                if loaded:
+                    print(f"Loaded model(s): {', '.join(loaded)}")
+            except Exception as e:
+                print(f"Model warm-up failed: {e}")
+            self._stop.wait(interval)
+
+    def observe(self, current, model, response):
+        """
+        Record a finished request as cold (it waited on a model load) or warm, on the span and in
+        the per-model latency counters.
+        """
+        total = (_field(response, "total_duration") or 0) / 1e9
+        if not total:
+            return
+        load = (_field(response, "load_duration") or 0) / 1e9
+        kind = "cold" if load > COLD_LOAD_SECONDS else "warm"
+        if current is not None:
+            current.set(**{"llm.cold": kind == "cold", "llm.load_seconds": round(load, 3)})
+        with self._lock:
+            entry = self.latency.setdefault(model, {"cold": [0, 0.0], "warm": [0, 0.0]})
+            entry[kind][0] += 1
+            entry[kind][1] += total
+
+    def get_latency(self):
+        """
+        Return {model: {"cold": {"count", "mean_seconds"}, "warm": {...}}}.
+        """
+        with self._lock:
+            return {model: {kind: {"count": count, "mean_seconds": round(seconds / count, 3) if count else 0.0}
+                            for kind, (count, seconds) in entry.items()}
+                    for model, entry in self.latency.items()}
+
+    def print_latency(self):
+        for model, entry in sorted(self.get_latency().items()):
+            print(f"Model {model}: {entry['warm']['count']} warm requests (mean {entry['warm']['mean_seconds']}s), "
+                  f"{entry['cold']['count']} cold (mean {entry['cold']['mean_seconds']}s)")
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+def get_model_manager():
+    """
+    Return the process-wide model manager, creating it on first use.
+    """
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = ModelManager()
+        return _default_manager
+
+def main():
+    parser = argparse.ArgumentParser(description="Preload the Ollama models or probe whether they are loaded.")
+    parser.add_argument("--preload", action="store_true", help="Load (and pull if needed) the models, then exit")
+    parser.add_argument("--probe", action="store_true", help="Exit with status 0 when every model is loaded, 1 otherwise")
+    args = parser.parse_args()
+
+    manager = get_model_manager()
+    if args.preload:
+        for host, timings in manager.preload().items():
+            for model, seconds in timings.items():
+                print(f"Loaded {model} on {host} in {seconds}s")
+    if args.probe or not args.preload:
+        ready = manager.is_ready()
+        print("ready" if ready else "not ready")
+        sys.exit(0 if ready else 1)
+
+if __name__ == "__main__":
+    main()
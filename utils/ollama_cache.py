@@ -0,0 +1,210 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Directory where cached LLM responses are stored
+DEFAULT_CACHE_DIR = os.environ.get("OLLAMA_CACHE_DIR", os.path.join(os.environ.get("SITES_DIR", "/mnt/sites"), ".cache", "ollama"))
+
+# Size-based LRU limit and time-to-live for cached responses
+DEFAULT_MAX_BYTES = int(os.environ.get("OLLAMA_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+DEFAULT_TTL = int(os.environ.get("OLLAMA_CACHE_TTL", 7 * 24 * 3600))
+
+
+def cache_bypassed():
+    """
+    Return True when the cache is disabled through the OLLAMA_CACHE_BYPASS environment variable.
+    """
+    return os.environ.get("OLLAMA_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+def make_cache_key(model, messages, options=None, format=None):
+    """
+    Build a content-addressed key from everything that influences the model output.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "options": options or {}, "format": format},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        """
+        On-disk cache of Ollama responses. Each entry is a file named after its key:
+        <key>.json for complete chat responses, <key>.txt for streamed text.
+        The file mtime is the creation time (TTL) and the atime the last use (LRU).
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _stream_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def get(self, key):
+        """
+        Return the cached response for the key, or None on a miss or an expired entry.
+        An entry that cannot be decoded counts as a miss and is deleted.
+        """
+        path = self._lookup(self._entry_path(key), record=False)
+        response = None
+        if path is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    response = json.load(file)["response"]
+            except (OSError, ValueError, KeyError, TypeError):
+                self._remove(path)  # Truncated or corrupt
+        self._record(hit=response is not None)
+        return response
+
+    def get_stream_path(self, key):
+        """
+        Return the path of the cached streamed text for the key, or None on a miss.
+        """
+        return self._lookup(self._stream_path(key))
+
+    def _lookup(self, path, record=True):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if record:
+                self._record(hit=False)
+            return None
+
+        now = time.time()
+        if self.ttl and now - stat.st_mtime > self.ttl:
+            self._remove(path)
+            if record:
+                self._record(hit=False)
+            return None
+
+        # Mark the entry as recently used while keeping its creation time
+        try:
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+        if record:
+            self._record(hit=True)
+        return path
+
+    def put(self, key, response):
+        """
+        Store a response under the key and evict the least recently used entries if over budget.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {"response": response}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(entry, file, ensure_ascii=False)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            print(f"Error writing Ollama cache entry: {e}")
+            self._remove(tmp_path)
+            return
+        self.evict()
+
+    @contextlib.contextmanager
+    def stream_writer(self, key):
+        """
+        Context manager yielding a file to spool streamed text into. The entry only becomes
+        visible once the block completes, so an interrupted stream is never cached.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                yield file
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        os.replace(tmp_path, self._stream_path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Delete expired entries, then the oldest entries until the cache fits in max_bytes.
+        """
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith((".json", ".txt"))]
+        except FileNotFoundError:
+            return
+
+        now = time.time()
+        entries = []
+        total = 0
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self.ttl and now - stat.st_mtime > self.ttl:
+                self._remove(path)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove every cached entry.
+        """
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            self._remove(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        """
+        Return hit/miss counters for this process.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    Return the process-wide response cache, creating it on first use.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
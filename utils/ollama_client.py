@@ -1,24 +1,168 @@
-import ollama
+import asyncio
+import os
+import time
 
-def generate_text_with_ollama(prompt):
-    response = ollama.chat(model="llama3.1", messages=[{"role": "user", "content": prompt}])
+from utils.model_manager import DEFAULT_MODEL, get_model_manager
+from utils.ollama_pool import POOL_CAPACITY
+from utils.ollama_cache import cache_bypassed, get_default_cache, make_cache_key
+from utils.tracing import end_span, record_llm_usage, span, start_span
+
+# Requests in flight at once across every Ollama backend (the sum of their OLLAMA_NUM_PARALLEL caps)
+DEFAULT_NUM_PARALLEL = POOL_CAPACITY
+
+def chat_with_ollama(messages, model=DEFAULT_MODEL, options=None, use_cache=True, format=None):
+    """
+    Send a chat request to Ollama, serving repeated requests from the on-disk response cache.
+    Set use_cache=False or OLLAMA_CACHE_BYPASS=1 to always query the model.
+    `format` ("json" or a JSON schema) constrains the reply to structured output.
+    """
+    with span("llm.chat", **{"llm.model": model, "llm.prompt_chars": _prompt_chars(messages)}) as current:
+        if not use_cache or cache_bypassed():
+            return _chat(current, model, messages, options, format)
+
+        cache = get_default_cache()
+        key = make_cache_key(model, messages, options, format)
+        cached = cache.get(key)
+        current.set(**{"llm.cached": cached is not None})
+        if cached is not None:
+            return cached
+
+        response = _chat(current, model, messages, options, format)
+        # Only keep the serialisable part of the response
+        result = {"model": model, "message": {"role": "assistant", "content": response['message']['content']}}
+        cache.put(key, result)
+        return result
+
+async def achat_with_ollama(messages, model=DEFAULT_MODEL, options=None, use_cache=True, client=None, format=None):
+    """
+    Async counterpart of chat_with_ollama using ollama.AsyncClient, sharing the same response cache.
+    Cache reads, writes and evictions run in a worker thread so they never block the event loop.
+    """
+    manager = get_model_manager()
+    client = client or manager.async_client()
+    with span("llm.achat", **{"llm.model": model, "llm.prompt_chars": _prompt_chars(messages)}) as current:
+        if not use_cache or cache_bypassed():
+            response = await client.chat(model=model, messages=messages, options=options, format=format,
+                                         keep_alive=manager.keep_alive)
+            record_llm_usage(current, response)
+            manager.observe(current, model, response)
+            return response
+
+        cache = get_default_cache()
+        key = make_cache_key(model, messages, options, format)
+        cached = await asyncio.to_thread(cache.get, key)
+        current.set(**{"llm.cached": cached is not None})
+        if cached is not None:
+            return cached
+
+        response = await client.chat(model=model, messages=messages, options=options, format=format,
+                                     keep_alive=manager.keep_alive)
+        record_llm_usage(current, response)
+        manager.observe(current, model, response)
+        result = {"model": model, "message": {"role": "assistant", "content": response['message']['content']}}
+        await asyncio.to_thread(cache.put, key, result)
+        return result
+
+def _chat(current, model, messages, options, format):
+    # Every request carries keep_alive so the model stays pinned between requests
+    manager = get_model_manager()
+    response = manager.pool.chat(model=model, messages=messages, options=options, format=format,
+                                   keep_alive=manager.keep_alive)
+    record_llm_usage(current, response)
+    manager.observe(current, model, response)
+    return response
+
+def generate_text_with_ollama(prompt, use_cache=True):
+    response = chat_with_ollama([{"role": "user", "content": prompt}], use_cache=use_cache)
     return response['message']['content']
 
-def replace_theme_with_ai(stack, config_file, new_theme):
-    with open(config_file, 'r') as file:
-        config_content = file.read()
+def stream_chat_with_ollama(messages, model=DEFAULT_MODEL, options=None, use_cache=True):
+    """
+    Yield the response text chunk by chunk as Ollama produces it (stream=True).
+    Cached responses are replayed from disk; fresh ones are spooled to the cache while streaming.
+    The llm.stream span is recorded once the stream is exhausted or closed; it is never the
+    current span, so spans the consumer opens between chunks do not nest under it.
+    """
+    current = start_span("llm.stream", **{"llm.model": model, "llm.prompt_chars": _prompt_chars(messages)})
+    try:
+        if not use_cache or cache_bypassed():
+            yield from _stream_chunks(model, messages, options, current)
+            return
+
+        cache = get_default_cache()
+        key = make_cache_key(model, messages, options)
+        cached_path = cache.get_stream_path(key)
+        current.set(**{"llm.cached": cached_path is not None})
+        if cached_path is not None:
+            with open(cached_path, 'r', encoding='utf-8') as file:
+                for chunk in iter(lambda: file.read(4096), ''):
+                    current.add("io.bytes", len(chunk))
+                    yield chunk
+            return
+
+        with cache.stream_writer(key) as spool:
+            for chunk in _stream_chunks(model, messages, options, current):
+                spool.write(chunk)
+                yield chunk
+    except GeneratorExit:
+        current.set(**{"llm.stream_closed": True})  # The consumer stopped reading early
+        raise
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        end_span(current)
 
-    prompt = f"""
-    You are an expert in web development. You have the following configuration file:
-    {config_content}
-    Your task is to identify where the current theme is set, and replace it with the new theme: {new_theme}.
-    Please return the updated configuration file with the theme changed accordingly.
+def _stream_chunks(model, messages, options, current=None):
+    manager = get_model_manager()
+    started = time.perf_counter()
+    for part in manager.pool.chat(model=model, messages=messages, options=options, stream=True,
+                                    keep_alive=manager.keep_alive):
+        content = part['message']['content']
+        if part.get('done'):
+            manager.observe(current, model, part)
+        if current is not None:
+            if content and "llm.first_token_seconds" not in current.attributes:
+                current.set(**{"llm.first_token_seconds": time.perf_counter() - started})
+            if part.get('done'):
+                record_llm_usage(current, part, started)
+        if content:
+            yield content
+
+def _prompt_chars(messages):
+    return sum(len(message.get('content') or '') for message in messages)
+
+def stream_text_to_files(prompt, output_files, echo=False, use_cache=True, header=""):
+    """
+    Stream the response to a prompt into every output file as tokens arrive, flushing after
+    each chunk so the files can be watched while the model is still generating. `header`
+    (e.g. front matter) is written before the response. Returns the number of characters streamed.
     """
-    response = ollama.chat(model="llama3.1", messages=[{"role": "user", "content": prompt}])
-    updated_config = response['message']['content']
+    files = []
+    written = 0
+    try:
+        for path in output_files:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            files.append(open(path, 'w', encoding='utf-8'))
+            files[-1].write(header)
 
-    with open(config_file, 'w') as file:
-        file.write(updated_config)
+        for chunk in stream_chat_with_ollama([{"role": "user", "content": prompt}], use_cache=use_cache):
+            for file in files:
+                file.write(chunk)
+                file.flush()
+            if echo:
+                print(chunk, end="", flush=True)
+            written += len(chunk)
+    finally:
+        for file in files:
+            file.close()
 
-    print(f"Theme successfully updated in {config_file}.")
+    if echo:
+        print()
+    return written
 
+def get_cache_stats():
+    """
+    Return the hit/miss counters of the shared response cache.
+    """
+    return get_default_cache().stats()
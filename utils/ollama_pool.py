@@ -0,0 +1,283 @@
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+import ollama
+
+from utils.tracing import span
+
+def parse_hosts(value, default_concurrency):
+    """
+    Parse "http://gpu1:11434=4,http://cpu1:11434=1" into [(host, max_concurrency)]. Entries
+    without "=<n>" get default_concurrency.
+    """
+    hosts = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, concurrency = entry.rpartition("=") if "=" in entry else (entry, "", "")
+        hosts.append((host.strip(), int(concurrency) if concurrency else default_concurrency))
+    return hosts
+
+# Requests each Ollama server processes in parallel (matches the server's OLLAMA_NUM_PARALLEL)
+DEFAULT_NUM_PARALLEL = int(os.environ.get("OLLAMA_NUM_PARALLEL", 4))
+
+# Ollama servers requests are balanced across, each optionally with its own cap ("host=n").
+# Defaults to the single OLLAMA_HOST the client library would use.
+OLLAMA_HOSTS = parse_hosts(os.environ.get("OLLAMA_HOSTS", os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")),
+                           DEFAULT_NUM_PARALLEL)
+
+# Requests in flight across the whole pool; callers size their own concurrency from it
+POOL_CAPACITY = sum(concurrency for _, concurrency in OLLAMA_HOSTS)
+
+# Seconds a request waits for a free slot before giving up
+ACQUIRE_TIMEOUT = float(os.environ.get("OLLAMA_ACQUIRE_TIMEOUT", 600))
+
+# A failed backend is skipped for 1s, 2s, 4s... up to this many seconds
+MAX_BACKOFF_SECONDS = 30.0
+
+class NoBackendAvailable(RuntimeError):
+    """
+    Raised when no Ollama backend can take a request: all of them failed it, or none freed a slot in time.
+    """
+
+def model_tag(model):
+    # /api/ps reports "llama3.1:latest" for "llama3.1"
+    return model if ":" in model else f"{model}:latest"
+
+def is_backend_failure(error):
+    """
+    True for errors that say the node is unusable (unreachable, timed out, 5xx), as opposed to a
+    bad request that would fail on every node.
+    """
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError, OSError))
+
+def should_retry(error):
+    # A missing model (404) only concerns that node; another one may have it
+    return is_backend_failure(error) or isinstance(error, ollama.ResponseError) and error.status_code == 404
+
+class Backend:
+    def __init__(self, host, max_concurrency=DEFAULT_NUM_PARALLEL):
+        """
+        One Ollama server of the pool, with its request cap, health and the models it has loaded.
+        """
+        self.host = host
+        self.max_concurrency = max(1, max_concurrency)
+        self.client = ollama.Client(host=host)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0  # Consecutive failures, for the backoff
+        self.healthy = True
+        self.retry_at = 0.0
+        self.loaded = set()
+
+    def available(self, now):
+        return self.healthy or now >= self.retry_at
+
+    def stats(self):
+        return {"host": self.host, "healthy": self.healthy, "outstanding": self.outstanding,
+                "max_concurrency": self.max_concurrency, "requests": self.requests, "errors": self.errors,
+                "loaded": sorted(self.loaded)}
+
+class OllamaPool:
+    def __init__(self, hosts=None, acquire_timeout=ACQUIRE_TIMEOUT):
+        """
+        Client pool over several Ollama servers. Each request goes to the healthy backend with the
+        fewest outstanding requests relative to its cap, preferring backends that already have the
+        model loaded. A backend that fails a request is skipped with exponential backoff and the
+        request is retried on another one.
+        """
+        self.backends = [Backend(host, concurrency) for host, concurrency in (hosts or OLLAMA_HOSTS)]
+        self.acquire_timeout = acquire_timeout
+        self._condition = threading.Condition()
+
+    @property
+    def capacity(self):
+        return sum(backend.max_concurrency for backend in self.backends)
+
+    def try_acquire(self, model, exclude=()):
+        """
+        Reserve a slot on the best backend for the model and return it, or None when every usable
+        backend is at its cap. Raises NoBackendAvailable when all backends are excluded.
+        """
+        with self._condition:
+            now = time.monotonic()
+            candidates = [backend for backend in self.backends if backend not in exclude]
+            if not candidates:
+                raise NoBackendAvailable(f"All {len(self.backends)} Ollama backend(s) failed the request")
+            usable = [backend for backend in candidates if backend.available(now)]
+            if not usable:
+                # Everything is backing off: probe the backend that recovers first
+                usable = [min(candidates, key=lambda backend: backend.retry_at)]
+            free = [backend for backend in usable if backend.outstanding < backend.max_concurrency]
+            if not free:
+                return None
+            warm = [backend for backend in free if model_tag(model) in backend.loaded]
+            backend = min(warm or free, key=lambda backend: (backend.outstanding / backend.max_concurrency, backend.requests))
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def acquire(self, model, exclude=(), timeout=None):
+        """
+        Like try_acquire, but wait up to `timeout` seconds (default acquire_timeout) for a free slot.
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        with self._condition:
+            while True:
+                backend = self.try_acquire(model, exclude)
+                if backend is not None:
+                    return backend
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoBackendAvailable("Timed out waiting for a free Ollama backend")
+                # Also wake up when a backing-off backend becomes usable again
+                self._condition.wait(min(remaining, 1.0))
+
+    def release(self, backend, model, error=None):
+        """
+        Return a slot taken with acquire. `error` is the exception that ended the request; a
+        cancellation or interrupt (not an Exception) only frees the slot.
+        """
+        with self._condition:
+            backend.outstanding -= 1
+            if error is None:
+                backend.healthy = True
+                backend.failures = 0
+                backend.loaded.add(model_tag(model))
+            elif not isinstance(error, Exception):
+                pass  # The request was abandoned; this says nothing about the backend
+            elif is_backend_failure(error):
+                backend.errors += 1
+                backend.failures += 1
+                backend.healthy = False
+                backend.retry_at = time.monotonic() + min(MAX_BACKOFF_SECONDS, 2 ** (backend.failures - 1))
+            else:
+                backend.errors += 1
+            self._condition.notify_all()
+
+    def update_backend(self, backend, loaded=None, error=None):
+        """
+        Record the outcome of a health probe: the models loaded on the backend, or the probe's error.
+        """
+        with self._condition:
+            if error is not None:
+                backend.failures += 1
+                backend.healthy = False
+                backend.retry_at = time.monotonic() + min(MAX_BACKOFF_SECONDS, 2 ** (backend.failures - 1))
+            else:
+                backend.healthy = True
+                backend.failures = 0
+                backend.loaded = set(loaded or ())
+            self._condition.notify_all()
+
+    def chat(self, model, stream=False, **kwargs):
+        """
+        ollama.Client.chat routed through the pool. Streams are only retried on another backend
+        when the failure happened before the first chunk.
+        """
+        if stream:
+            return self._stream_chat(model, kwargs)
+        tried = []
+        while True:
+            backend = self.acquire(model, tried)
+            error = None
+            with span("llm.request", **{"llm.backend": backend.host, "llm.attempt": len(tried) + 1}):
+                try:
+                    response = backend.client.chat(model=model, **kwargs)
+                except BaseException as e:
+                    error = e
+                    tried.append(backend)
+                    if not isinstance(e, Exception) or not should_retry(e) or len(tried) >= len(self.backends):
+                        raise
+                    print(f"Ollama backend {backend.host} failed ({e}); retrying on another backend")
+                    continue
+                finally:
+                    self.release(backend, model, error)
+            return response
+
+    def _stream_chat(self, model, kwargs):
+        tried = []
+        while True:
+            backend = self.acquire(model, tried)
+            started = False
+            error = None
+            try:
+                for part in backend.client.chat(model=model, stream=True, **kwargs):
+                    started = True
+                    yield part
+            except GeneratorExit:
+                raise  # The consumer stopped reading; the backend served it fine
+            except BaseException as e:
+                error = e
+                tried.append(backend)
+                if (not isinstance(e, Exception) or started or not should_retry(e)
+                        or len(tried) >= len(self.backends)):
+                    raise
+                print(f"Ollama backend {backend.host} failed ({e}); retrying on another backend")
+                continue
+            finally:
+                self.release(backend, model, error)
+            return
+
+    def async_client(self):
+        return AsyncPoolClient(self)
+
+    def stats(self):
+        with self._condition:
+            return [backend.stats() for backend in self.backends]
+
+class AsyncPoolClient:
+    def __init__(self, pool):
+        """
+        Async counterpart of OllamaPool.chat, with one ollama.AsyncClient per backend. Create one
+        per event loop, as with ollama.AsyncClient.
+        """
+        self.pool = pool
+        self.clients = {}
+
+    def get_client(self, backend):
+        if backend.host not in self.clients:
+            self.clients[backend.host] = ollama.AsyncClient(host=backend.host)
+        return self.clients[backend.host]
+
+    async def acquire(self, model, exclude):
+        """
+        Wait for a slot in a worker thread. If the wait is cancelled, the slot the thread still
+        takes afterwards is handed back as soon as it has it.
+        """
+        task = asyncio.ensure_future(asyncio.to_thread(self.pool.acquire, model, tuple(exclude)))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            def release_slot(done):
+                if not done.cancelled() and done.exception() is None:
+                    self.pool.release(done.result(), model, asyncio.CancelledError())
+            task.add_done_callback(release_slot)
+            raise
+
+    async def chat(self, model, **kwargs):
+        tried = []
+        while True:
+            # Only block a worker thread when every backend is at its cap
+            backend = self.pool.try_acquire(model, tried) or await self.acquire(model, tried)
+            error = None
+            with span("llm.request", **{"llm.backend": backend.host, "llm.attempt": len(tried) + 1}):
+                try:
+                    response = await self.get_client(backend).chat(model=model, **kwargs)
+                except BaseException as e:
+                    error = e
+                    tried.append(backend)
+                    if not isinstance(e, Exception) or not should_retry(e) or len(tried) >= len(self.pool.backends):
+                        raise
+                    print(f"Ollama backend {backend.host} failed ({e}); retrying on another backend")
+                    continue
+                finally:
+                    self.pool.release(backend, model, error)
+            return response
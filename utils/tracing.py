@@ -0,0 +1,188 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import secrets
+import subprocess
+import threading
+import time
+
+# JSON lines export of finished spans; set GENERATOR_TRACE_FILE to an empty string to disable it
+TRACE_FILE = os.environ.get(
+    "GENERATOR_TRACE_FILE",
+    os.path.join(os.environ.get("SITES_DIR", "/mnt/sites"), ".logs", "trace.jsonl"),
+)
+
+# One trace per process run
+TRACE_ID = secrets.token_hex(16)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_summary = {}
+
+
+class Span:
+    def __init__(self, name, attributes):
+        """
+        A timed stage of the pipeline. Attributes follow OpenTelemetry naming (dotted keys),
+        e.g. llm.tokens, subprocess.seconds, http.bytes.
+        """
+        parent = _current_span.get()
+        self.name = name
+        self.attributes = dict(attributes)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def fail(self, error):
+        self.status = "error"
+        self.attributes["error"] = str(error) or type(error).__name__
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a span nested under the current one.
+    """
+    current = Span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(current)
+
+
+def start_span(name, **attributes):
+    """
+    Start a span under the current one without making it current, for work interleaved with
+    the caller's such as a generator between yields: spans the caller opens meanwhile are not
+    nested under it. Finish it with end_span().
+    """
+    return Span(name, attributes)
+
+
+def end_span(current):
+    """
+    Record a span started with start_span() (or by span()) as finished now.
+    """
+    _finish(current, current.start_ns, time.perf_counter() - current.started)
+
+
+def traced(name=None):
+    """
+    Decorator running the function inside a span named after it.
+    """
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_run(name, command, **kwargs):
+    """
+    subprocess.run inside a span recording the command, its exit status and wall time.
+    """
+    with span(name, **{"process.command": " ".join(str(part) for part in command[:3])}) as current:
+        started = time.perf_counter()
+        try:
+            result = subprocess.run(command, **kwargs)
+        except subprocess.CalledProcessError as e:
+            current.set(**{"process.exit_code": e.returncode})
+            raise
+        finally:
+            current.set(**{"subprocess.seconds": time.perf_counter() - started})
+        current.set(**{"process.exit_code": result.returncode})
+        return result
+
+
+def record_llm_usage(current, response, started=None):
+    """
+    Copy token counts from an Ollama response (or final stream chunk) onto a span.
+    """
+    eval_count = _field(response, "eval_count")
+    eval_duration = _field(response, "eval_duration")
+    if not eval_count:
+        return
+    current.add("llm.tokens", eval_count)
+    if eval_duration:
+        current.set(**{"llm.tokens_per_sec": round(eval_count / (eval_duration / 1e9), 2)})
+    elif started is not None:
+        current.set(**{"llm.tokens_per_sec": round(eval_count / max(time.perf_counter() - started, 1e-9), 2)})
+
+
+def _field(response, key):
+    try:
+        return response[key]
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def _finish(current, start_ns, duration):
+    record = {
+        "trace_id": TRACE_ID,
+        "span_id": current.span_id,
+        "parent_span_id": current.parent_id,
+        "name": current.name,
+        "start_time_unix_nano": start_ns,
+        "end_time_unix_nano": start_ns + int(duration * 1e9),
+        "attributes": current.attributes,
+        "status": current.status,
+    }
+    with _lock:
+        entry = _summary.setdefault(current.name, {"count": 0, "total": 0.0, "max": 0.0, "errors": 0, "tokens": 0, "bytes": 0})
+        entry["count"] += 1
+        entry["total"] += duration
+        entry["max"] = max(entry["max"], duration)
+        entry["errors"] += current.status != "ok"
+        entry["tokens"] += current.attributes.get("llm.tokens", 0)
+        entry["bytes"] += current.attributes.get("http.bytes", 0) + current.attributes.get("io.bytes", 0)
+
+        if TRACE_FILE:
+            try:
+                os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+                with open(TRACE_FILE, "a") as file:
+                    file.write(json.dumps(record, default=str) + "\n")
+            except OSError:
+                pass
+
+
+def get_summary():
+    """
+    Return the per-stage aggregates of this run: count, total/max seconds, errors, tokens and bytes.
+    """
+    with _lock:
+        return {name: dict(entry) for name, entry in _summary.items()}
+
+
+def print_summary(title="Timing summary"):
+    """
+    Print the per-stage summary table, slowest stages first.
+    """
+    summary = get_summary()
+    if not summary:
+        return
+    width = max(len(name) for name in summary)
+    print(f"\n{title} (trace {TRACE_ID})")
+    print(f"  {'stage':<{width}}  {'count':>5}  {'total s':>9}  {'mean s':>8}  {'max s':>8}  {'tokens':>7}  {'tok/s':>7}  {'bytes':>10}")
+    for name, entry in sorted(summary.items(), key=lambda item: item[1]["total"], reverse=True):
+        tokens_per_sec = entry["tokens"] / entry["total"] if entry["tokens"] and entry["total"] else 0
+        print(f"  {name:<{width}}  {entry['count']:>5}  {entry['total']:>9.3f}  {entry['total'] / entry['count']:>8.3f}  "
+              f"{entry['max']:>8.3f}  {entry['tokens']:>7}  {tokens_per_sec:>7.1f}  {entry['bytes']:>10}")